@@ -1,29 +1,38 @@
+import concurrent.futures
+import functools
+import heapq
 import logging
 import os
 import tempfile
 import asyncio
-import traceback
+import uuid
+from itertools import islice
 import re
-from typing import List, Tuple, Dict, Set, Optional
+from pathlib import Path
+from urllib.parse import urlparse
+from typing import Callable, Dict, List, Tuple, Optional
 
-from telegram import Update, BotCommand, InputFile
+import httpx
+from werkzeug.utils import secure_filename
+from telegram import Update, BotCommand
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     ApplicationBuilder,
-    CallbackContext,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes,
-    ConversationHandler
 )
+from telegram.request import HTTPXRequest
 
 # Relative imports from parent directories
-from ..config import app_config
-from ..core.metadata import MetadataManager
+from ..config import get_config
+from ..core.metadata import MetadataManager, FileManifest
 from ..core.chunk_manager import ChunkManager
 from ..chatbot.chatbot import ChatbotClient
 from ..core.file_processor import FileProcessor
+from ..core.cache import single_instance
 
 # Basic logging setup
 logging.basicConfig(
@@ -33,67 +42,174 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
-# Initialize core components
-metadata_manager_bot = MetadataManager(metadata_dir="metadata")
-chunk_manager_bot = ChunkManager(metadata_manager_bot)
-chatbot_client = ChatbotClient()
-file_processor = FileProcessor(metadata_manager_bot, chunk_manager_bot)
+# Core components are created on first use so importing this module has no side effects
+@single_instance
+def get_metadata_manager() -> MetadataManager:
+    return MetadataManager(metadata_dir="metadata")
+
+@single_instance
+def get_chunk_manager() -> ChunkManager:
+    return ChunkManager(get_metadata_manager())
+
+@single_instance
+def get_file_processor() -> FileProcessor:
+    return FileProcessor(get_metadata_manager(), get_chunk_manager())
+
+@single_instance
+def get_chatbot_client() -> ChatbotClient:
+    client = ChatbotClient()
+    # Set file processor for chatbot
+    client.set_file_processor(get_file_processor())
+    return client
+
+_HELP_TEXT = (
+    "Available commands:\n"
+    "/list - List all stored files\n"
+    "/download <file_id> - Download a file by its ID\n"
+    "/delete <file_id> - Delete a file by its ID\n"
+    "/context - Manage files in your AI context\n"
+    "\nFile Context Features:\n"
+    "- Upload any document to add it to your AI context automatically\n"
+    "- Send text messages to ask questions about your uploaded files\n"
+    "- Use /context to view, add, remove, or clear files from your context\n"
+    "- Supported file formats for AI context: PDF, TXT, DOCX, DOC\n"
+)
+
+_CONTEXT_USAGE = (
+    "/context add <file_id> - Add a file to context\n"
+    "/context remove <file_id> - Remove a file from context\n"
+    "/context clear - Clear all file contexts"
+)
+
+_BOT_COMMANDS = (
+    BotCommand("start", "Start interacting with the bot"),
+    BotCommand("help", "Show available commands"),
+    BotCommand("list", "List stored files"),
+    BotCommand("download", "Download a file by ID (e.g., /download <file_id>)"),
+    BotCommand("delete", "Delete a file by ID (e.g., /delete <file_id>)"),
+    BotCommand("context", "Manage file contexts for conversation"),
+)
+
+@functools.lru_cache(maxsize=1)
+def _bot_tmp_dir() -> str:
+    """Scratch directory shared by all bot downloads, created once per process."""
+    tmp_dir = os.path.join(tempfile.gettempdir(), "ass_bot")
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+@functools.lru_cache(maxsize=1)
+def _io_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Bounded pool for storage and filesystem work, kept apart from the loop's default executor."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=BOT_IO_WORKERS, thread_name_prefix="bot-io")
+
+async def _run_io(func, *args, **kwargs):
+    """Runs a blocking storage or filesystem call without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor(), functools.partial(func, *args, **kwargs))
+
+async def _load_manifests(file_ids) -> List[Tuple[str, Optional[FileManifest]]]:
+    """Loads several manifests concurrently (served from the metadata cache when unchanged)."""
+    file_ids = list(file_ids)
+    manifests = await asyncio.gather(*(_run_io(get_metadata_manager().load_manifest, fid) for fid in file_ids))
+    return list(zip(file_ids, manifests))
+
+def _remove_file(path: str):
+    """Deletes a scratch file, ignoring files that are already gone."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Translation table used to escape HTML characters for safe display
+_HTML_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+def escape_html(text: str) -> str:
+    """Escapes the characters Telegram's HTML parse mode treats as markup, in a single pass."""
+    return text.translate(_HTML_ESCAPE_TABLE)
+
+# Maximum number of entries rendered by /list and the character budget for them
+# (Telegram messages are capped at 4096 chars, the rest is left for the trailer)
+LIST_MAX_ENTRIES = 100
+LIST_MESSAGE_LIMIT = 4000
 
-# Set file processor for chatbot
-chatbot_client.set_file_processor(file_processor)
+# Largest document a bot can send back through the Telegram Bot API
+TELEGRAM_MAX_UPLOAD_SIZE = 50 * 1024 * 1024
 
-# Track active file contexts per user
-user_active_files: Dict[int, Set[str]] = {}
+# Size of the blocks read from Telegram while streaming an upload
+UPLOAD_STREAM_BLOCK_SIZE = 1024 * 1024
+
+# Keywords suggesting a message is about the user's files; matched as substrings like before
+# ("files" counts as "file"), in one case-insensitive pass without lowercasing the prompt
+_FILE_QUESTION_RE = re.compile(r"file|document|pdf|text|content|read|extract|information", re.IGNORECASE)
+_FILE_MENTION_RE = re.compile(r"file|document|pdf|upload", re.IGNORECASE)
+
+# Concurrent uploads/downloads handled off the event loop
+BOT_IO_WORKERS = 8
+
+# Outgoing requests per second across all chats (Telegram allows ~30) and retries on 429 responses
+TELEGRAM_OVERALL_MAX_RATE = 28
+TELEGRAM_MAX_RETRIES = 3
+
+# Upper bound on open connections to the Bot API (HTTP/2 multiplexes requests over few of them)
+TELEGRAM_CONNECTION_POOL_SIZE = 128
+
+# Seconds between typing actions while waiting on the chatbot
+TYPING_REFRESH_INTERVAL = 4
+
+# Streamed answers are shown by editing the reply at most this often (seconds), and split
+# into a new message before reaching Telegram's 4096 character cap
+STREAM_EDIT_INTERVAL = 1.5
+STREAM_MESSAGE_LIMIT = 4000
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sends a welcome message."""
     user = update.effective_user
-    await update.message.reply_html(
-        rf"Hi {user.mention_html()}! I'm the Amazing Storage Bot. "
-        rf"Send me a file to upload it, or use /help to see commands.",
-    )
+    greeting = "I'm the Amazing Storage Bot. Send me a file to upload it, or use /help to see commands."
+    if update.effective_chat.type == 'private':
+        # No markup needed in a private chat, so skip the HTML parse mode
+        await update.message.reply_text(f"Hi {user.first_name or 'there'}! {greeting}")
+    else:
+        # In groups the mention tells members who the greeting is for
+        await update.message.reply_html(f"Hi {user.mention_html()}! {greeting}")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Lists available commands."""
-    help_text = (
-        "Available commands:\n"
-        "/list - List all stored files\n"
-        "/download <file_id> - Download a file by its ID\n"
-        "/delete <file_id> - Delete a file by its ID\n"
-        "/context - Manage files in your AI context\n"
-        "\nFile Context Features:\n"
-        "- Upload any document to add it to your AI context automatically\n"
-        "- Send text messages to ask questions about your uploaded files\n"
-        "- Use /context to view, add, remove, or clear files from your context\n"
-        "- Supported file formats for AI context: PDF, TXT, DOCX, DOC\n"
-    )
-    await update.message.reply_text(help_text)
+    await update.message.reply_text(_HELP_TEXT)
 
 async def list_files_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Lists stored files."""
     logger.info(f"User {update.effective_user.id} requested file list.")
     try:
-        files: List[Tuple[str, str]] = chunk_manager_bot.list_files()
+        # Listing reads every manifest (cached ones skip the JSON parse), so keep it off the event loop
+        files: List[Tuple[str, str]] = await _run_io(get_chunk_manager().list_files)
         if not files:
             await update.message.reply_text("No files stored yet.")
             return
 
-        message = "Stored files:\n\n"
-        files.sort(key=lambda item: item[1].lower())
-
-        # Function to escape HTML characters for safe display
-        def escape_html(text: str) -> str:
-            return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-
-        for file_id, filename in files:
+        # Only the first entries fit in one Telegram message, so partially sort
+        # on precomputed keys instead of sorting the whole listing
+        decorated = [(filename.casefold(), file_id, filename) for file_id, filename in files]
+        shown = heapq.nsmallest(LIST_MAX_ENTRIES, decorated)
+
+        # Collect the pieces and join once; stop before exceeding Telegram's limit (4096 chars)
+        # rather than slicing the finished message, which could cut an HTML tag in half
+        parts = ["Stored files:\n\n"]
+        length = len(parts[0])
+        listed = 0
+        for _, file_id, filename in shown:
             safe_filename = escape_html(filename)
             safe_file_id = escape_html(file_id)
-            message += f"- <code>{safe_filename}</code>\n  ID: <code>{safe_file_id}</code>\n"
+            entry = f"- <code>{safe_filename}</code>\n  ID: <code>{safe_file_id}</code>\n"
+            if length + len(entry) > LIST_MESSAGE_LIMIT:
+                break
+            parts.append(entry)
+            length += len(entry)
+            listed += 1
 
-        # Truncate message if it exceeds Telegram's limit (4096 chars)
-        if len(message) > 4096:
-             message = message[:4000] + "\n... (list truncated)"
+        if len(files) > listed:
+            parts.append(f"\n... and {len(files) - listed} more files")
+        message = "".join(parts)
 
         await update.message.reply_html(message)
 
@@ -101,6 +217,17 @@ async def list_files_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         logger.error(f"Error listing files for user {update.effective_user.id}: {e}", exc_info=True)
         await update.message.reply_text(f"Sorry, an error occurred while listing files: {e}")
 
+@single_instance
+def _download_client() -> httpx.Client:
+    """HTTP client shared by streamed uploads so connections to Telegram's file server are reused."""
+    return httpx.Client(timeout=60)
+
+def _stream_upload(file_url: str, original_filename: str) -> str:
+    """Pipes a Telegram file download straight into the chunk manager (no temp file)."""
+    with _download_client().stream("GET", file_url) as response:
+        response.raise_for_status()
+        return get_chunk_manager().upload_stream(response.iter_bytes(UPLOAD_STREAM_BLOCK_SIZE), original_filename)
+
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles file uploads and processes them for AI context."""
     if not update.message or not update.message.document:
@@ -115,8 +242,6 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"User {user_id} is uploading '{original_filename}' (Size: ~{file_size / (1024*1024):.2f} MB)")
     await update.message.reply_text(f"Received '{original_filename}'. Starting upload process...")
 
-    temp_dir = tempfile.mkdtemp(prefix='ass_bot_upload_')
-    temp_path = os.path.join(temp_dir, original_filename)
     file_id_telegram = doc.file_id
 
     try:
@@ -125,36 +250,22 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         bot = context.bot
         file_telegram = await bot.get_file(file_id_telegram)
-        logger.info(f"Downloading Telegram file {file_id_telegram} to {temp_path}")
-        await file_telegram.download_to_drive(temp_path)
-        logger.info(f"Downloaded successfully.")
-
-        logger.info(f"Starting chunked upload for {temp_path}")
-        uploaded_file_id = chunk_manager_bot.upload_file(temp_path, original_filename=original_filename)
+        logger.info(f"Streaming Telegram file {file_id_telegram} into chunked upload")
+        uploaded_file_id = await _run_io(_stream_upload, file_telegram.file_path, original_filename)
 
         if uploaded_file_id:
             logger.info(f"Successfully uploaded '{original_filename}' for user {user_id}. File ID: {uploaded_file_id}")
             
-            # Add file to user's active files for LLM context
-            if user_id not in user_active_files:
-                user_active_files[user_id] = set()
-            user_active_files[user_id].add(uploaded_file_id)
-            
-            # Add file to chatbot context
-            success, message = chatbot_client.add_file_to_context(str(user_id), uploaded_file_id)
-            
-            # Check if file is supported for text extraction
-            file_ext = original_filename.split('.')[-1].lower() if '.' in original_filename else ''
-            supported_formats = ['pdf', 'txt', 'docx', 'doc']
-            
-            if file_ext in supported_formats:
-                context_status = "File added to AI context. You can now ask questions about it!" if success else f"Note: {message}"
+            if get_file_processor().is_supported(original_filename):
+                # Add file to chatbot context; its text is extracted in the background while the user reads the reply
+                await asyncio.to_thread(get_chatbot_client().prefetch_file_to_context, str(user_id), uploaded_file_id)
+                context_status = "The file is being processed for AI context; questions about it will wait until it is ready."
             else:
-                context_status = f"Note: File format '.{file_ext}' may not be fully supported for AI context. Supported formats: PDF, TXT, DOCX."
+                context_status = "Note: text cannot be extracted from this file type, so it was not added to AI context. Supported formats: PDF, TXT, DOCX."
             
-            await update.message.reply_text(
-                f"Successfully uploaded '{original_filename}'\nFile ID: `{uploaded_file_id}`\n\n{context_status}",
-                parse_mode='MarkdownV2' # Use Markdown for backticks around ID
+            # HTML like /list; MarkdownV2 would need every '.', '!' or '-' in the text escaped
+            await update.message.reply_html(
+                f"Successfully uploaded '{escape_html(original_filename)}'\nFile ID: <code>{uploaded_file_id}</code>\n\n{escape_html(context_status)}"
             )
         else:
             logger.error(f"Chunked upload failed for '{original_filename}' from user {user_id}.")
@@ -163,16 +274,6 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Error processing upload for '{original_filename}' from user {user_id}: {e}", exc_info=True)
         await update.message.reply_text(f"An unexpected error occurred during upload: {e}")
-    finally:
-        # Clean up temporary resources
-        try:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            if os.path.exists(temp_dir):
-                 os.rmdir(temp_dir) # Only removes if empty
-            logger.info(f"Cleaned up temporary upload resources for '{original_filename}'.")
-        except OSError as cleanup_error:
-            logger.error(f"Error cleaning up temp file/dir {temp_path}: {cleanup_error}")
 
 
 async def download_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -185,40 +286,51 @@ async def download_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     file_id_to_download = context.args[0]
     logger.info(f"User {user_id} requested download for file ID: {file_id_to_download}")
 
-    manifest = metadata_manager_bot.load_manifest(file_id_to_download)
+    manifest = await _run_io(get_metadata_manager().load_manifest, file_id_to_download)
     if not manifest:
         await update.message.reply_text(f"Error: File ID '{file_id_to_download}' not found.")
         return
 
+    # Check file size before reassembling (Telegram has limits, often 50MB for bots).
+    # The chunk sizes are recorded in the manifest, so no chunk has to be fetched for this.
+    # Older manifests may lack them; those files are checked on disk after reassembly instead.
+    sizes_known = all(chunk.size > 0 for chunk in manifest.chunks)
+    file_size = sum(chunk.size for chunk in manifest.chunks)
+    if sizes_known and file_size > TELEGRAM_MAX_UPLOAD_SIZE:
+        logger.warning(f"File {file_id_to_download} ({file_size} bytes) exceeds Telegram bot limit.")
+        await update.message.reply_text(f"Sorry, '{manifest.original_filename}' is too large ({file_size / (1024*1024):.1f}MB) to send back via Telegram.")
+        return
+
     await update.message.reply_text(f"Starting download for '{manifest.original_filename}'...")
 
-    temp_dir = tempfile.mkdtemp(prefix='ass_bot_download_')
     # Use secure_filename to prevent path traversal or other issues, even if filename comes from trusted manifest
-    from werkzeug.utils import secure_filename
     safe_filename = secure_filename(manifest.original_filename)
-    download_path = os.path.join(temp_dir, safe_filename)
 
+    # Reassemble into the shared scratch directory under a unique name
+    download_path = os.path.join(_bot_tmp_dir(), f"{uuid.uuid4().hex}_{safe_filename}")
     try:
         logger.info(f"Downloading file {file_id_to_download} to temp path {download_path}")
-        chunk_manager_bot.download_file(file_id_to_download, download_path)
+        await _run_io(get_chunk_manager().download_file, file_id_to_download, download_path)
         logger.info(f"File reassembled locally at {download_path}")
 
-        # Check file size before sending (Telegram has limits, often 50MB for bots)
-        file_size = os.path.getsize(download_path)
-        if file_size > 50 * 1024 * 1024: # 50MB limit
-             logger.warning(f"File {download_path} ({file_size} bytes) exceeds Telegram bot limit.")
-             await update.message.reply_text(f"Sorry, '{manifest.original_filename}' is too large ({file_size / (1024*1024):.1f}MB) to send back via Telegram.")
-             return
+        if not sizes_known:
+            file_size = await _run_io(os.path.getsize, download_path)
+            if file_size > TELEGRAM_MAX_UPLOAD_SIZE:
+                logger.warning(f"File {download_path} ({file_size} bytes) exceeds Telegram bot limit.")
+                await update.message.reply_text(f"Sorry, '{manifest.original_filename}' is too large ({file_size / (1024*1024):.1f}MB) to send back via Telegram.")
+                return
 
         # Send the document with increased timeouts for potentially large files
         await update.message.reply_text("Reassembly complete. Sending file back to you now...")
-        with open(download_path, 'rb') as doc_file:
-            await update.message.reply_document(
-                document=doc_file,
-                filename=manifest.original_filename,
-                read_timeout=60, # Increased read timeout (default is 20s)
-                write_timeout=60 # Increased write timeout (default is 20s)
-            )
+        # The library would read a path synchronously on the event loop, so read it on the I/O pool
+        # (the size checks above keep this under Telegram's 50MB limit)
+        document = await _run_io(Path(download_path).read_bytes)
+        await update.message.reply_document(
+            document=document,
+            filename=manifest.original_filename,
+            read_timeout=60, # Increased read timeout (default is 20s)
+            write_timeout=60 # Increased write timeout (default is 20s)
+        )
         logger.info(f"Successfully sent file {file_id_to_download} to user {user_id}.")
 
     except FileNotFoundError as e:
@@ -228,17 +340,11 @@ async def download_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error processing download for {file_id_to_download} from user {user_id}: {e}", exc_info=True)
         await update.message.reply_text(f"An unexpected error occurred during download: {e}")
     finally:
-        # Clean up temporary resources
+        # Clean up the reassembled file
         try:
-            if os.path.exists(download_path):
-                os.remove(download_path)
-            if os.path.exists(temp_dir):
-                # Use shutil.rmtree for potentially non-empty dirs if errors occur, but rmdir is safer first
-                # shutil.rmtree(temp_dir, ignore_errors=True)
-                os.rmdir(temp_dir)
-            logger.info(f"Cleaned up temporary download resources for '{file_id_to_download}'.")
+            await _run_io(_remove_file, download_path)
         except OSError as cleanup_error:
-             logger.error(f"Error cleaning up temp file/dir {download_path}: {cleanup_error}")
+            logger.error(f"Error cleaning up temp file {download_path}: {cleanup_error}")
 
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /delete command."""
@@ -251,11 +357,11 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"User {user_id} requested deletion for file ID: {file_id_to_delete}")
 
     # Check if file exists first to provide a better user message
-    manifest = metadata_manager_bot.load_manifest(file_id_to_delete)
+    manifest = await _run_io(get_metadata_manager().load_manifest, file_id_to_delete)
     original_name = manifest.original_filename if manifest else "(unknown name)"
 
     try:
-        success = chunk_manager_bot.delete_file(file_id_to_delete)
+        success = await _run_io(get_chunk_manager().delete_file, file_id_to_delete)
         if success:
             logger.info(f"Successfully deleted file ID {file_id_to_delete} (name: {original_name}) for user {user_id}.")
             await update.message.reply_text(f"Successfully deleted file '{original_name}' (ID: {file_id_to_delete}).")
@@ -272,6 +378,20 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"An unexpected error occurred during deletion: {e}")
 
 
+async def _keep_typing(bot, chat_id: int):
+    """Re-sends the typing action until cancelled, since Telegram clears it after ~5 seconds."""
+    while True:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action="typing")
+        except Exception as e:
+            logger.debug(f"Could not send typing action to chat {chat_id}: {e}")
+        await asyncio.sleep(TYPING_REFRESH_INTERVAL)
+
+
+# Messages of a user's burst not answered yet, and the task that will answer them
+_pending_prompts: Dict[int, List[str]] = {}
+_flush_tasks: Dict[int, asyncio.Task] = {}
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles regular text messages by sending them to the chatbot with file context."""
     if not update.message or not update.message.text:
@@ -281,70 +401,145 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     prompt = update.message.text
     logger.info(f"User {user_id} sent text message: '{prompt[:50]}...'")
 
-    if not chatbot_client.is_enabled():
+    if not get_chatbot_client().is_enabled():
         logger.warning("Chatbot is disabled, ignoring text message.")
         await update.message.reply_text(
             "Sorry, the AI assistant is not currently enabled. Please check your configuration or try again later."
         )
         return
 
-    # Indicate the bot is processing
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
+    delay = float(get_config().chatbot_debounce_seconds)
+    if delay <= 0:
+        await _answer_prompt(update, context, prompt)
+        return
+
+    # Users often split one question over several quick messages. A message with nothing
+    # pending is answered right away; a follow-up that arrives before that answer goes out
+    # cancels it, and everything pending is answered together once the user pauses.
+    in_burst = user_id in _flush_tasks
+    _pending_prompts.setdefault(user_id, []).append(prompt)
+    previous = _flush_tasks.get(user_id)
+    if previous:
+        previous.cancel()
+    # Tasks go through the application, which keeps a reference to them and reports their errors
+    _flush_tasks[user_id] = context.application.create_task(
+        _flush_prompts(delay if in_burst else 0, update, context), update=update)
+
+
+async def _flush_prompts(delay: float, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Waits out the debounce window, then answers everything the user sent so far."""
+    user_id = update.effective_user.id
+    task = asyncio.current_task()
+
+    def commit():
+        # Past this point the batch is answered; newer messages start a fresh one
+        if _flush_tasks.get(user_id) is task:
+            del _flush_tasks[user_id]
+            _pending_prompts.pop(user_id, None)
+
+    try:
+        await asyncio.sleep(delay)
+        await _answer_prompt(update, context, "\n".join(_pending_prompts.get(user_id, ())), on_reply=commit)
+    finally:
+        commit()
+
+
+async def _reply_streaming(message, pieces, header: str = "", on_reply: Optional[Callable[[], None]] = None):
+    """Replies with an answer while it is generated, editing the reply as more text arrives.
+
+    on_reply, if given, is called just before the first message is sent.
+    """
+    loop = asyncio.get_running_loop()
+    reply = None
+    text = shown = ""
+    last_edit = 0.0
+    async for piece in pieces:
+        if not piece:
+            continue
+        if reply is None and not text and piece.startswith("Sorry"):
+            header = ""  # Don't label refusals and errors with the files used
+        while piece:
+            if len(header) + len(text) + len(piece) > STREAM_MESSAGE_LIMIT and text:
+                # Finish this message and carry on in a new one
+                if shown != text:
+                    await reply.edit_text(header + text)
+                reply, header, text, shown = None, "", "", ""
+            # A piece longer than a message is spread over several
+            part = piece[:STREAM_MESSAGE_LIMIT - len(header) - len(text)]
+            piece = piece[len(part):]
+            text += part
+            if reply is None:
+                if on_reply is not None:
+                    on_reply()
+                    on_reply = None
+                reply = await message.reply_text(header + text)
+                shown, last_edit = text, loop.time()
+            elif loop.time() - last_edit >= STREAM_EDIT_INTERVAL:
+                await reply.edit_text(header + text)
+                shown, last_edit = text, loop.time()
+    if reply is not None and shown != text:
+        await reply.edit_text(header + text)
+
+
+async def _answer_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE, prompt: str,
+                         on_reply: Optional[Callable[[], None]] = None):
+    """Gets the chatbot's answer to prompt and replies to the update's message.
+
+    on_reply, if given, is called just before the first reply is sent.
+    """
+    on_reply = on_reply or (lambda: None)
+    user_id = update.effective_user.id
+
+    # Indicate the bot is processing while the LLM call runs, instead of before it
+    typing_task = asyncio.create_task(_keep_typing(context.bot, update.effective_chat.id))
 
     try:
         # Check if user has active file contexts
-        has_context = user_id in user_active_files and len(user_active_files[user_id]) > 0
+        active_file_ids = await asyncio.to_thread(get_chatbot_client().list_files, str(user_id))
         
-        if has_context:
-            file_count = len(user_active_files[user_id])
+        if active_file_ids:
+            file_count = len(active_file_ids)
             logger.info(f"User {user_id} has {file_count} active file contexts")
             
-            # Get file names for context information
-            file_names = []
-            for file_id in user_active_files[user_id]:
-                manifest = metadata_manager_bot.load_manifest(file_id)
-                if manifest:
-                    file_names.append(manifest.original_filename)
-            
-            # If this appears to be a question about uploaded files
-            file_related_keywords = ['file', 'document', 'pdf', 'text', 'content', 'read', 'extract', 'information']
-            is_file_question = any(keyword in prompt.lower() for keyword in file_related_keywords)
-            
-            if is_file_question and not file_names:
-                # User might be asking about files but we don't have names
-                context_info = f"(Using {file_count} uploaded files as context)"
-            elif is_file_question and file_names:
-                # User is asking about files and we have names
-                files_str = ", ".join([f"'{name}'" for name in file_names[:3]])
-                if len(file_names) > 3:
-                    files_str += f" and {len(file_names) - 3} more"
-                context_info = f"(Using files as context: {files_str})"
-            else:
-                context_info = ""
-            
-            # Get response from LLM with user's file context
-            response_text = chatbot_client.get_response(prompt, str(user_id))
+            # If this appears to be a question about uploaded files, say which files are used;
+            # the names are only looked up when they will actually be shown
+            context_info = ""
+            if _FILE_QUESTION_RE.search(prompt):
+                manifests = await _load_manifests(active_file_ids)
+                file_names = [manifest.original_filename for _, manifest in manifests if manifest]
+                if file_names:
+                    files_str = ", ".join(f"'{name}'" for name in islice(file_names, 3))
+                    if len(file_names) > 3:
+                        files_str += f" and {len(file_names) - 3} more"
+                    context_info = f"(Using files as context: {files_str})"
+                else:
+                    # User might be asking about files but we don't have names
+                    context_info = f"(Using {file_count} uploaded files as context)"
             
             # Add context info if relevant
-            if context_info and not response_text.startswith("Sorry"):
-                response_text = f"{context_info}\n\n{response_text}"
+            header = f"{context_info}\n\n" if context_info else ""
         else:
             # No file context available
-            if any(word in prompt.lower() for word in ['file', 'document', 'pdf', 'upload']):
+            if _FILE_MENTION_RE.search(prompt):
                 # User might be asking about files but has none uploaded
+                on_reply()
                 await update.message.reply_text(
                     "You don't have any files uploaded for context. Please upload a document first, then ask questions about it."
                 )
                 return
             
             # Regular response without file context
-            response_text = chatbot_client.get_response(prompt, str(user_id))
+            header = ""
         
-        # Send the chatbot's response back
-        await update.message.reply_text(response_text)
+        # Stream the chatbot's response back (with the user's file context, if any)
+        pieces = get_chatbot_client().stream_response_async(prompt, str(user_id))
+        await _reply_streaming(update.message, pieces, header, on_reply)
     except Exception as e:
         logger.error(f"Error getting chatbot response for user {user_id}: {e}", exc_info=True)
+        on_reply()
         await update.message.reply_text("Sorry, I encountered an error trying to process your request. Please try again later.")
+    finally:
+        typing_task.cancel()
 
 
 
@@ -355,17 +550,19 @@ async def file_context_command(update: Update, context: ContextTypes.DEFAULT_TYP
     
     if not context.args or len(context.args) < 1:
         # Show current active files
-        if user_id in user_active_files and user_active_files[user_id]:
-            active_files = []
-            for file_id in user_active_files[user_id]:
-                manifest = metadata_manager_bot.load_manifest(file_id)
-                if manifest:
-                    active_files.append(f"- {manifest.original_filename} (ID: {file_id})")
+        active_file_ids = await asyncio.to_thread(get_chatbot_client().list_files, str(user_id))
+        if active_file_ids:
+            active_files = [
+                f"- {manifest.original_filename} (ID: {file_id})"
+                for file_id, manifest in await _load_manifests(active_file_ids)
+                if manifest
+            ]
             
-            await update.message.reply_text(
-                f"Your active file contexts ({len(active_files)}):\n" + "\n".join(active_files) + 
-                "\n\nUsage:\n/context add <file_id> - Add a file to context\n/context remove <file_id> - Remove a file from context\n/context clear - Clear all file contexts"
-            )
+            await update.message.reply_text("\n".join([
+                f"Your active file contexts ({len(active_files)}):",
+                *active_files,
+                f"\nUsage:\n{_CONTEXT_USAGE}",
+            ]))
         else:
             await update.message.reply_text(
                 "You don't have any active file contexts.\n\n" +
@@ -377,33 +574,27 @@ async def file_context_command(update: Update, context: ContextTypes.DEFAULT_TYP
     
     if action == "add" and len(context.args) >= 2:
         file_id = context.args[1]
-        manifest = metadata_manager_bot.load_manifest(file_id)
+        manifest = await _run_io(get_metadata_manager().load_manifest, file_id)
         
         if not manifest:
             await update.message.reply_text(f"File with ID {file_id} not found.")
             return
         
-        # Add to user's active files
-        if user_id not in user_active_files:
-            user_active_files[user_id] = set()
-        user_active_files[user_id].add(file_id)
-        
-        # Add to chatbot context
-        success, message = chatbot_client.add_file_to_context(str(user_id), file_id)
+        if not get_file_processor().is_supported(manifest.original_filename):
+            await update.message.reply_text(
+                f"Text cannot be extracted from '{manifest.original_filename}' (unsupported file type), so it was not added to your context."
+            )
+            return
         
-        if success:
-            await update.message.reply_text(f"Added '{manifest.original_filename}' to your conversation context. You can now ask questions about it!")
-        else:
-            await update.message.reply_text(f"Error adding file to context: {message}")
+        # Add to chatbot context (the text is extracted in the background)
+        await asyncio.to_thread(get_chatbot_client().prefetch_file_to_context, str(user_id), file_id)
+        await update.message.reply_text(f"'{manifest.original_filename}' is being processed for your conversation context. Questions about it will wait until it is ready.")
     
     elif action == "remove" and len(context.args) >= 2:
         file_id = context.args[1]
         
-        if user_id in user_active_files and file_id in user_active_files[user_id]:
-            user_active_files[user_id].remove(file_id)
-            chatbot_client.remove_file_from_context(str(user_id), file_id)
-            
-            manifest = metadata_manager_bot.load_manifest(file_id)
+        if await asyncio.to_thread(get_chatbot_client().remove_file_from_context, str(user_id), file_id):
+            manifest = await _run_io(get_metadata_manager().load_manifest, file_id)
             filename = manifest.original_filename if manifest else file_id
             
             await update.message.reply_text(f"Removed '{filename}' from your conversation context.")
@@ -411,48 +602,40 @@ async def file_context_command(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text(f"File with ID {file_id} is not in your active context.")
     
     elif action == "clear":
-        if user_id in user_active_files:
-            # Remove all files from context
-            for file_id in list(user_active_files[user_id]):
-                chatbot_client.remove_file_from_context(str(user_id), file_id)
-            
-            user_active_files[user_id] = set()
+        if await asyncio.to_thread(get_chatbot_client().clear_files, str(user_id)):
             await update.message.reply_text("Cleared all files from your conversation context.")
         else:
             await update.message.reply_text("You don't have any active file contexts.")
     
     else:
         await update.message.reply_text(
-            "Invalid command. Usage:\n" +
-            "/context - Show active file contexts\n" +
-            "/context add <file_id> - Add a file to context\n" +
-            "/context remove <file_id> - Remove a file from context\n" +
-            "/context clear - Clear all file contexts"
+            "Invalid command. Usage:\n/context - Show active file contexts\n" + _CONTEXT_USAGE
         )
 
 async def post_init(application: Application):
-    """Sets the bot commands list after initialization."""
-    commands = [
-        BotCommand("start", "Start interacting with the bot"),
-        BotCommand("help", "Show available commands"),
-        BotCommand("list", "List stored files"),
-        BotCommand("download", "Download a file by ID (e.g., /download <file_id>)"),
-        BotCommand("delete", "Delete a file by ID (e.g., /delete <file_id>)"),
-        BotCommand("context", "Manage file contexts for conversation"),
-    ]
-    await application.bot.set_my_commands(commands)
+    """Creates the core components and sets the bot commands list after initialization."""
+    # Building the storage side authenticates with every provider, so do it once, off the event loop;
+    # the handlers' get_*() calls then only return the shared instances. The chatbot client makes
+    # no network calls when created, and its asyncio primitives are created on the loop.
+    await _run_io(get_file_processor)
+    get_chatbot_client()
+    await application.bot.set_my_commands(_BOT_COMMANDS)
     logger.info("Bot commands set.")
 
-    # Add message handlers here - post_init ensures the Application object is fully ready
-    application.add_handler(MessageHandler(filters.Document.ALL, handle_document)) # Handle any document
-    # Add the text message handler - Filters.TEXT & ~filters.COMMAND ensures it only catches non-command text
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
-    # Potential future handlers:
-    # application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
 
+def _build_request() -> HTTPXRequest:
+    """HTTP/2 transport for the Bot API so concurrent calls share one multiplexed connection."""
+    return HTTPXRequest(
+        connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE,
+        connect_timeout=10.0,
+        read_timeout=30.0,
+        pool_timeout=5.0,
+        http_version="2",
+    )
 
 def run_bot():
     """Configures and runs the Telegram bot."""
+    app_config = get_config()
     bot_token = app_config.telegram_bot_token
     if not bot_token:
         logger.error("Telegram bot token (ASS_TELEGRAM_BOT_TOKEN) not found. Bot cannot start.")
@@ -461,8 +644,29 @@ def run_bot():
 
     logger.info("Starting Telegram bot...")
 
-    # Build the application, adding post_init hook
-    application = ApplicationBuilder().token(bot_token).post_init(post_init).build()
+    try:
+        import uvloop # Optional: faster event loop (not available on Windows)
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop.")
+    except ImportError:
+        pass
+
+    # Build the application, adding post_init hook. Every outgoing API call goes through the
+    # rate limiter, which keeps us under Telegram's flood limits and retries 429s after RetryAfter
+    rate_limiter = AIORateLimiter(
+        overall_max_rate=TELEGRAM_OVERALL_MAX_RATE,
+        overall_time_period=1,
+        max_retries=TELEGRAM_MAX_RETRIES,
+    )
+    application = (
+        ApplicationBuilder()
+        .token(bot_token)
+        .request(_build_request())
+        .get_updates_request(_build_request())
+        .rate_limiter(rate_limiter)
+        .post_init(post_init)
+        .build()
+    )
 
     # Register command handlers
     application.add_handler(CommandHandler("start", start))
@@ -471,11 +675,31 @@ def run_bot():
     application.add_handler(CommandHandler("download", download_command))
     application.add_handler(CommandHandler("delete", delete_command))
     application.add_handler(CommandHandler("context", file_context_command))
-    # Message handlers are added in post_init
 
-    # Start polling for updates
-    print("Telegram bot started. Press Ctrl-C to stop.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Register message handlers
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document)) # Handle any document
+    # Add the text message handler - Filters.TEXT & ~filters.COMMAND ensures it only catches non-command text
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    # Potential future handlers:
+    # application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+    logger.info(f"Registered {len(application.handlers[0])} handlers.")
+
+    webhook_url = app_config.telegram_webhook_url
+    if webhook_url:
+        # Telegram pushes updates to us; the local route must match the path of the public URL
+        print(f"Telegram bot started with webhook {webhook_url}. Press Ctrl-C to stop.")
+        application.run_webhook(
+            listen=app_config.telegram_webhook_listen,
+            port=int(app_config.telegram_webhook_port),
+            url_path=urlparse(webhook_url).path.lstrip("/"),
+            webhook_url=webhook_url,
+            secret_token=app_config.telegram_webhook_secret,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        # Start polling for updates
+        print("Telegram bot started. Press Ctrl-C to stop.")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
     print("Telegram bot stopped.")
 
 
@@ -1,22 +1,130 @@
-import google.generativeai as genai
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import hashlib
+import json
 import logging
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
 
-from ..config import app_config
+from ..config import get_config
+from ..core.cache import LRUCache
 from ..core.file_processor import FileProcessor
+from .context_store import create_file_sets
+from .semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
+# Identical prompts (same user, same document context) within this window reuse the previous answer
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 60  # seconds
+
+SYSTEM_CONTEXT = (
+    "You are an AI assistant that helps users understand their documents. "
+    "Below are the contents of documents the user has uploaded. "
+    "Use this information to answer the user's questions about these documents. "
+    "If the question is not related to the documents, you can answer based on your general knowledge."
+)
+
+# Large document sets are uploaded once as a Gemini CachedContent and referenced by later
+# questions instead of being resent with every prompt. Gemini only accepts caches above a
+# minimum size and requires a pinned model version for them.
+CONTEXT_CACHE_MODEL = "models/gemini-1.5-flash-002"
+CONTEXT_CACHE_MIN_TOKENS = 32768
+CONTEXT_CACHE_TTL = 3600  # seconds
+CONTEXT_CACHE_REFRESH_MARGIN = 60  # recreate a little before Gemini expires the cache
+CHARS_PER_TOKEN = 4  # rough estimate, good enough to decide whether caching is worth it
+
+# Documents are cut to this many characters when they enter a context (Gemini has context limits)
+MAX_CTX_CHARS = 10000
+
+# Background threads extracting the text of files added with prefetch_file_to_context
+PREFETCH_WORKERS = 4
+
+# When a user's documents together exceed the context budget, the newest stay verbatim and
+# older ones are dropped ("prune") or replaced by a short summary ("summarize")
+CONTEXT_POLICIES = ("prune", "summarize")
+SUMMARY_CACHE_SIZE = 256
+SUMMARY_PROMPT = "Summarize the following document in about 300 tokens, keeping names, figures and key facts:\n\n"
+
+# Optional semantic cache: near-identical questions over the same documents reuse an earlier answer
+EMBEDDING_MODEL = "models/text-embedding-004"
+SEMANTIC_CACHE_SIZE = 256  # answers kept per user
+
+# Questions from the same user are answered by one call, at most this many at a time
+# (larger batches get slower and less accurate)
+BATCH_MAX_SIZE = 8
+
+BLOCKED_RESPONSE = "Sorry, I couldn't generate a response for that (it might have been blocked)."
+
+# (user_id, digest of the user's document context or b"", digest of the question)
+_CacheKey = Tuple[Optional[str], bytes, bytes]
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+@dataclass
+class _ContextCache:
+    """A user's server-side document cache and the model bound to it."""
+    file_ids: FrozenSet[str]
+    cached_content: Any
+    model: Any
+    expires_at: float
+
+def _truncate(content: str) -> str:
+    """Cuts document text down to MAX_CTX_CHARS."""
+    if len(content) > MAX_CTX_CHARS:
+        return content[:MAX_CTX_CHARS] + "... [content truncated]"
+    return content
+
 class ChatbotClient:
     """Client to interact with the configured chatbot LLM."""
 
     def __init__(self):
+        app_config = get_config()
         self.api_key = app_config.chatbot_api_key
         self.provider = app_config.chatbot_provider
         self.client = None
         self.model = None
+        self.document_model = None  # same model with SYSTEM_CONTEXT as its system instruction
         self.file_processor = None  # Will be set externally
-        self.conversation_contexts: Dict[str, Dict[str, str]] = {}  # user_id -> {file_id -> content}
+        # Which files each user has in context; shared through Redis when redis_url is configured
+        self.active_files = create_file_sets(app_config.redis_url)
+        # Files whose text this process holds for each user, oldest first; the text itself is shared between users.
+        # Users are kept in least-recently-used order and evicted beyond chatbot_max_users.
+        self.conversation_contexts: "OrderedDict[str, Dict[str, None]]" = OrderedDict()  # user_id -> {file_id: None}
+        self._max_users = max(1, int(app_config.chatbot_max_users))
+        self._content_store: Dict[str, Tuple[str, str]] = {}  # file_id -> (filename, truncated content)
+        self._content_refcount: Dict[str, int] = {}  # file_id -> number of users holding it
+        self._prefetches: Dict[str, concurrent.futures.Future] = {}  # file_id -> extraction in progress
+        self._prefetch_executor = None  # created on first prefetch
+        # The bot and web handlers call in from worker threads, so guard the per-user dicts
+        self._contexts_lock = threading.Lock()
+        self._context_caches: Dict[str, _ContextCache] = {}  # user_id -> Gemini cached document context
+        # user_id -> (file IDs, formatted "Reference Documents" text, digest of that text),
+        # rebuilt only when the files change
+        self._prefix_cache: Dict[str, Tuple[FrozenSet[str], str, bytes]] = {}
+        self._response_cache = LRUCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+        # Values from the environment arrive as strings, so "0" has to be converted before testing it
+        budget_tokens = int(app_config.chatbot_context_budget_tokens or 0)
+        self._context_budget = budget_tokens * CHARS_PER_TOKEN if budget_tokens > 0 else None  # in characters
+        self._context_policy = (app_config.chatbot_context_policy or "prune").lower()
+        if self._context_policy not in CONTEXT_POLICIES:
+            logger.warning(f"Unknown chatbot context policy '{self._context_policy}', using 'prune'.")
+            self._context_policy = "prune"
+        self._summaries = LRUCache(maxsize=SUMMARY_CACHE_SIZE)  # file_id -> summary of its text
+        self._semantic_cache = None
+        semantic_threshold = float(app_config.chatbot_semantic_cache_threshold or 0)
+        if semantic_threshold > 0:
+            self._semantic_cache = SemanticCache(threshold=semantic_threshold, maxsize=SEMANTIC_CACHE_SIZE)
+        # Cap in-flight LLM requests so a burst of messages can't open unbounded connections
+        max_concurrency = int(app_config.chatbot_max_concurrency)
+        self._async_semaphore = asyncio.Semaphore(max_concurrency)
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrency)
 
         if not self.api_key:
             logger.warning("Chatbot API key not configured. Chatbot disabled.")
@@ -24,15 +132,19 @@ class ChatbotClient:
         
         if self.provider and self.provider.lower() == 'gemini':
             try:
+                # Imported here so deployments without the chatbot skip the SDK's import cost
+                import google.generativeai as genai
                 genai.configure(api_key=self.api_key)
                 
                 self.model = genai.GenerativeModel('gemini-1.5-flash')
+                self.document_model = genai.GenerativeModel('gemini-1.5-flash', system_instruction=SYSTEM_CONTEXT)
                 self.client = genai
                 logger.info(f"Gemini chatbot client initialized with model: {self.model.model_name}")
             except Exception as e:
                 logger.error(f"Failed to initialize Gemini client: {e}", exc_info=True)
                 self.client = None
                 self.model = None
+                self.document_model = None
         else:
             logger.warning(f"Chatbot provider '{self.provider}' not recognized or configured. Chatbot disabled.")
 
@@ -58,18 +170,16 @@ class ChatbotClient:
             return False, "File processor not initialized."
         
         try:
-            # Initialize user context if not exists
-            if user_id not in self.conversation_contexts:
-                self.conversation_contexts[user_id] = {}
-            
-            # Get file content
-            filename, content = self.file_processor.get_file_content(file_id)
+            with self._contexts_lock:
+                stored = self._content_store.get(file_id)
+            if stored is None:
+                # Get file content (outside the lock, extraction can be slow)
+                stored = self._load_content(file_id)
+            filename = stored[0]
             
             # Add to user's context
-            self.conversation_contexts[user_id][file_id] = {
-                'filename': filename,
-                'content': content
-            }
+            self._hold_content(user_id, file_id, stored)
+            self.active_files.add(user_id, file_id)
             
             return True, f"Added file '{filename}' to conversation context."
         
@@ -77,15 +187,332 @@ class ChatbotClient:
             logger.error(f"Error adding file {file_id} to context for user {user_id}: {e}", exc_info=True)
             return False, f"Error adding file to context: {str(e)}"
 
+    def prefetch_file_to_context(self, user_id: str, file_id: str) -> concurrent.futures.Future:
+        """Adds a file to the user's context right away and extracts its text in the background.
+
+        A question asked before the extraction finishes waits for it instead of extracting
+        the file again. Returns the future of the extraction.
+        """
+        self.active_files.add(user_id, file_id)
+        with self._contexts_lock:
+            self._prefix_cache.pop(user_id, None)
+            stored = self._content_store.get(file_id)
+        if stored is not None:
+            future = concurrent.futures.Future()
+            future.set_result(self._hold_content(user_id, file_id, stored))
+            return future
+        with self._contexts_lock:
+            future = self._prefetches.get(file_id)
+            if future is None:
+                if self._prefetch_executor is None:
+                    self._prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=PREFETCH_WORKERS, thread_name_prefix="chatbot-prefetch")
+                future = self._prefetch_executor.submit(self._load_content, file_id)
+                self._prefetches[file_id] = future
+        future.add_done_callback(functools.partial(self._finish_prefetch, user_id, file_id))
+        return future
+
+    def _finish_prefetch(self, user_id: str, file_id: str, future: concurrent.futures.Future):
+        """Stores prefetched text for the user, unless the file left their context in the meantime."""
+        with self._contexts_lock:
+            if self._prefetches.get(file_id) is future:
+                del self._prefetches[file_id]
+        try:
+            stored = future.result()
+        except Exception as e:
+            logger.error(f"Error prefetching file {file_id} for user {user_id}: {e}", exc_info=True)
+            return
+        if file_id in self.active_files.members(user_id):
+            self._hold_content(user_id, file_id, stored)
+
+    def _load_content(self, file_id: str) -> Tuple[str, str]:
+        """Extracts a file's text, truncated for use as context, as (filename, content)."""
+        filename, content = self.file_processor.get_file_content(file_id)
+        return filename, _truncate(content)
+
     def remove_file_from_context(self, user_id: str, file_id: str) -> bool:
         """Remove a file from the user's conversation context."""
-        if user_id in self.conversation_contexts and file_id in self.conversation_contexts[user_id]:
-            del self.conversation_contexts[user_id][file_id]
-            return True
-        return False
+        with self._contexts_lock:
+            self._release_content(user_id, [file_id])
+            self._prefix_cache.pop(user_id, None)
+        removed = self.active_files.remove(user_id, file_id)
+        if removed and not self.active_files.members(user_id):
+            self._drop_context_cache(user_id)
+        return removed
+
+    def list_files(self, user_id: str) -> FrozenSet[str]:
+        """Returns the IDs of the files in the user's conversation context."""
+        return self.active_files.members(user_id)
+
+    def clear_files(self, user_id: str) -> int:
+        """Removes every file from the user's conversation context and returns how many were removed."""
+        with self._contexts_lock:
+            self._release_content(user_id, list(self.conversation_contexts.get(user_id, ())))
+            self._prefix_cache.pop(user_id, None)
+        self._drop_context_cache(user_id)
+        return self.active_files.clear(user_id)
+
+    def refresh_file_content(self, file_id: str):
+        """Forgets the text held for a file whose content changed (a new or restored version).
+
+        Users with the file in context keep it there; its text is extracted again when they next ask something.
+        """
+        if self.file_processor:
+            self.file_processor.clear_cache(file_id)
+        self._summaries.pop(file_id)
+        with self._contexts_lock:
+            holders = [user_id for user_id, held in self.conversation_contexts.items() if file_id in held]
+            for user_id in holders:
+                self._release_content(user_id, [file_id])
+                self._prefix_cache.pop(user_id, None)
+        for user_id in holders:
+            self._drop_context_cache(user_id)
+
+    def _hold_content(self, user_id: str, file_id: str, stored: Tuple[str, str]) -> Tuple[str, str]:
+        """Records that the user holds a file's text, keeping one shared copy per file, and returns that copy.
+
+        The least recently used users beyond chatbot_max_users are evicted; their files stay in
+        their context and are loaded again when they next ask something.
+        """
+        evicted = []
+        with self._contexts_lock:
+            held = self.conversation_contexts.get(user_id)
+            if held is None:
+                held = self.conversation_contexts[user_id] = {}
+            else:
+                self.conversation_contexts.move_to_end(user_id)
+            if file_id not in held:
+                held[file_id] = None
+                self._content_store.setdefault(file_id, stored)
+                self._content_refcount[file_id] = self._content_refcount.get(file_id, 0) + 1
+            self._prefix_cache.pop(user_id, None)
+            stored = self._content_store[file_id]
+            while len(self.conversation_contexts) > self._max_users:
+                old_user = next(iter(self.conversation_contexts))
+                self._release_content(old_user, list(self.conversation_contexts[old_user]))
+                self.conversation_contexts.pop(old_user, None)
+                self._prefix_cache.pop(old_user, None)
+                evicted.append(old_user)
+        for old_user in evicted:
+            self._drop_context_cache(old_user)
+        return stored
+
+    def _release_content(self, user_id: str, file_ids: Iterable[str]):
+        """Releases the user's hold on files' text, freeing text nobody holds anymore. Call with the lock held."""
+        held = self.conversation_contexts.get(user_id)
+        if not held:
+            return
+        for file_id in file_ids:
+            if file_id not in held:
+                continue
+            del held[file_id]
+            remaining = self._content_refcount.get(file_id, 1) - 1
+            if remaining > 0:
+                self._content_refcount[file_id] = remaining
+            else:
+                self._content_refcount.pop(file_id, None)
+                self._content_store.pop(file_id, None)
+        if not held:
+            del self.conversation_contexts[user_id]
+
+    def _context_documents(self, user_id: str, active_ids: FrozenSet[str]) -> List[Tuple[str, Tuple[str, str]]]:
+        """Returns the user's active (file_id, (filename, content)) pairs, extracting any not loaded here yet."""
+        with self._contexts_lock:
+            held = self.conversation_contexts.get(user_id, {})
+            documents = [(file_id, self._content_store[file_id]) for file_id in held if file_id in active_ids]
+            missing = [file_id for file_id in active_ids if file_id not in held]
+        for file_id in missing:
+            if not self.file_processor:
+                break
+            with self._contexts_lock:
+                stored = self._content_store.get(file_id)
+                pending = self._prefetches.get(file_id)
+            if stored is None:
+                try:
+                    # Wait for a prefetch already extracting the file rather than doing it twice
+                    stored = pending.result() if pending else self._load_content(file_id)
+                except Exception as e:
+                    logger.error(f"Error loading file {file_id} into context for user {user_id}: {e}", exc_info=True)
+                    continue
+            documents.append((file_id, self._hold_content(user_id, file_id, stored)))
+        return documents
+
+    def _prepare_request(self, prompt: str, user_id: Optional[str]) -> Tuple[Any, str, _CacheKey]:
+        """Works out which model to call, the text to send it and the response-cache key.
+
+        Document context is either referenced through the user's Gemini context cache or,
+        for smaller document sets, prepended to the prompt; both carry SYSTEM_CONTEXT as the
+        system instruction.
+        """
+        active_ids = self.active_files.members(user_id) if user_id else frozenset()
+        if not active_ids:
+            return self.model, prompt, self._cache_key(user_id, b"", prompt)
+
+        file_ids, context_text, signature = self._context_prefix(user_id, active_ids)
+        if not file_ids:
+            return self.model, prompt, self._cache_key(user_id, b"", prompt)
+
+        question = f"User Question: {prompt}"
+        cache_key = self._cache_key(user_id, signature, question)
+        cached_model = self._cached_context_model(user_id, file_ids, context_text)
+        if cached_model is not None:
+            return cached_model, question, cache_key
+
+        return self.document_model, f"{context_text}\n\n{question}", cache_key
+
+    def _context_prefix(self, user_id: str, active_ids: FrozenSet[str]) -> Tuple[FrozenSet[str], str, bytes]:
+        """Builds the user's document context, reusing the last build while their files are unchanged.
+
+        Returns a (file_ids, context_text, digest) tuple: the IDs of the documents that made it
+        into the context (files that failed to load are left out), the formatted "Reference
+        Documents" text, and the digest of that text.
+        """
+        with self._contexts_lock:
+            entry = self._prefix_cache.get(user_id)
+            if user_id in self.conversation_contexts:
+                self.conversation_contexts.move_to_end(user_id)
+        if entry and entry[0] == active_ids:
+            return entry
+
+        documents = self._context_documents(user_id, active_ids)
+        parts = ["Reference Documents:\n"]
+        # Emit in file_id order so the same document set always produces the same prefix, and
+        # Gemini's implicit prefix caching keeps matching it; the question goes after it
+        for _, (filename, content) in sorted(self._fit_budget(documents), key=lambda document: document[0]):
+            parts.append(f"\n--- Document: {filename} ---\n{content}\n")
+        context_text = "".join(parts)
+        entry = (frozenset(file_id for file_id, _ in documents), context_text, _digest(context_text.encode('utf-8')))
+        logger.debug(f"Built document context for user {user_id}: {len(context_text)} chars, digest {entry[2].hex()}")
+        # Only reuse it while every active file made it in (one that failed to load is retried)
+        if entry[0] == active_ids:
+            with self._contexts_lock:
+                self._prefix_cache[user_id] = entry
+        return entry
+
+    def _fit_budget(self, documents: List[Tuple[str, Tuple[str, str]]]) -> List[Tuple[str, Tuple[str, str]]]:
+        """Keeps the documents within the context budget, giving room to the most recently added first."""
+        if self._context_budget is None or sum(len(content) for _, (_, content) in documents) <= self._context_budget:
+            return documents
+
+        remaining = self._context_budget
+        fitted = []
+        for file_id, (filename, content) in reversed(documents):
+            if len(content) > remaining and fitted:
+                if self._context_policy == "summarize":
+                    summary = self._summarize(file_id, content)
+                    if summary is not None and len(summary) <= remaining:
+                        fitted.append((file_id, (f"{filename} (summary)", summary)))
+                        remaining -= len(summary)
+                        continue
+                logger.info(f"Leaving '{filename}' out of the chatbot context, it does not fit the context budget.")
+                continue
+            # The newest document is always kept, it is already capped at MAX_CTX_CHARS
+            fitted.append((file_id, (filename, content)))
+            remaining -= len(content)
+        fitted.reverse()
+        return fitted
+
+    def _summarize(self, file_id: str, content: str) -> Optional[str]:
+        """Returns a short summary of a document's text, generated once per file."""
+        summary = self._summaries.get(file_id)
+        if summary is not None:
+            return summary
+        try:
+            with self._sync_semaphore:
+                response = self.model.generate_content(SUMMARY_PROMPT + content)
+            if not response.parts:
+                return None
+            summary = response.text
+        except Exception as e:
+            logger.warning(f"Could not summarize file {file_id} for the chatbot context: {e}")
+            return None
+        self._summaries.put(file_id, summary)
+        return summary
+
+    def _cached_context_model(self, user_id: str, file_ids: FrozenSet[str], context_text: str):
+        """Returns a model bound to a Gemini cache of the user's documents, or None to send them inline."""
+        if len(context_text) // CHARS_PER_TOKEN < CONTEXT_CACHE_MIN_TOKENS:
+            # Too small for Gemini to cache; drop any cache left from a larger document set
+            self._drop_context_cache(user_id)
+            return None
+
+        with self._contexts_lock:
+            entry = self._context_caches.get(user_id)
+        if entry and entry.file_ids == file_ids and entry.expires_at > time.monotonic():
+            return entry.model
+
+        # The document set changed or the cache is about to expire
+        self._drop_context_cache(user_id)
+        try:
+            from google.generativeai import caching
+            cached_content = caching.CachedContent.create(
+                model=CONTEXT_CACHE_MODEL,
+                system_instruction=SYSTEM_CONTEXT,
+                contents=[context_text],
+                ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL),
+            )
+            model = self.client.GenerativeModel.from_cached_content(cached_content=cached_content)
+        except Exception as e:
+            logger.warning(f"Could not create Gemini context cache for user {user_id}, sending documents inline: {e}")
+            return None
+
+        logger.info(f"Created Gemini context cache {cached_content.name} for user {user_id} ({len(file_ids)} files).")
+        expires_at = time.monotonic() + CONTEXT_CACHE_TTL - CONTEXT_CACHE_REFRESH_MARGIN
+        with self._contexts_lock:
+            self._context_caches[user_id] = _ContextCache(file_ids, cached_content, model, expires_at)
+        return model
+
+    def _drop_context_cache(self, user_id: str):
+        """Deletes the user's Gemini context cache, if there is one."""
+        with self._contexts_lock:
+            entry = self._context_caches.pop(user_id, None)
+        if entry is None:
+            return
+        try:
+            entry.cached_content.delete()
+        except Exception as e:
+            # It expires on its own after the TTL
+            logger.warning(f"Could not delete Gemini context cache for user {user_id}: {e}")
+
+    def _cache_key(self, user_id: Optional[str], signature: bytes, question: str) -> _CacheKey:
+        """Key for the response cache; the context digest is computed once per document set, so changes miss the cache."""
+        return user_id, signature, _digest(question.encode('utf-8'))
 
-    def get_response(self, prompt: str, user_id: Optional[str] = None) -> str:
-        """Gets a response from the configured LLM (synchronous).
+    def _semantic_lookup(self, prompt: str, cache_key: _CacheKey) -> Tuple[Optional[str], Optional[Tuple[str, List[float], bytes]]]:
+        """Looks the question up in the semantic cache.
+
+        Returns (cached answer or None, key to store the new answer under or None).
+        """
+        user_id, signature, _ = cache_key
+        if self._semantic_cache is None or not user_id:
+            return None, None
+        try:
+            embedding = self.client.embed_content(model=EMBEDDING_MODEL, content=prompt)['embedding']
+        except Exception as e:
+            logger.warning(f"Could not embed prompt for the semantic cache: {e}")
+            return None, None
+        return self._semantic_cache.get(user_id, embedding, signature), (user_id, embedding, signature)
+
+    def _finish_response(self, cache_key: _CacheKey, response,
+                         semantic_key: Optional[Tuple[str, List[float], bytes]] = None) -> str:
+        """Extracts the text of a Gemini response, caching it unless the response was blocked."""
+        if not response.parts:
+             logger.warning("Gemini response has no parts (potentially blocked).")
+             if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
+                  logger.warning(f"Prompt Feedback: {response.prompt_feedback}")
+             return BLOCKED_RESPONSE
+        self._remember(cache_key, response.text, semantic_key)
+        return response.text
+
+    def _remember(self, cache_key: _CacheKey, text: str,
+                  semantic_key: Optional[Tuple[str, List[float], bytes]] = None):
+        """Stores an answer in the response cache (and the semantic cache, when enabled)."""
+        self._response_cache.put(cache_key, text)
+        if semantic_key is not None:
+            self._semantic_cache.put(*semantic_key, text)
+
+    async def get_response(self, prompt: str, user_id: Optional[str] = None) -> str:
+        """Gets a response from the configured LLM without blocking the event loop.
         
         Args:
             prompt: The user's question or prompt
@@ -94,39 +521,55 @@ class ChatbotClient:
         if not self.is_enabled():
             return "Sorry, the chatbot is not configured or enabled."
 
-        # Build context-enhanced prompt if user_id is provided
-        enhanced_prompt = prompt
-        if user_id and user_id in self.conversation_contexts and self.conversation_contexts[user_id]:
-            context_text = "\n\nReference Documents:\n"
-            for file_id, file_data in self.conversation_contexts[user_id].items():
-                context_text += f"\n--- Document: {file_data['filename']} ---\n"
-                # Truncate content if too long (Gemini has context limits)
-                content = file_data['content']
-                if len(content) > 10000:  # Arbitrary limit, adjust based on model
-                    content = content[:10000] + "... [content truncated]"
-                context_text += content + "\n"
-            
-            # Create system context with file information
-            system_context = (
-                "You are an AI assistant that helps users understand their documents. "
-                "Below are the contents of documents the user has uploaded. "
-                "Use this information to answer the user's questions about these documents. "
-                "If the question is not related to the documents, you can answer based on your general knowledge."
-            )
-            
-            enhanced_prompt = f"{system_context}\n{context_text}\n\nUser Question: {prompt}"
+        # Preparing the request may hit Redis, extract a document or create a Gemini cache,
+        # so keep it off the event loop
+        model, request_text, cache_key = await asyncio.to_thread(self._prepare_request, prompt, user_id)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Returning cached chatbot response.")
+            return cached
+        cached, semantic_key = await asyncio.to_thread(self._semantic_lookup, prompt, cache_key)
+        if cached is not None:
+            logger.info("Returning semantically cached chatbot response.")
+            return cached
+
+        logger.info(f"Sending prompt to {self.provider}: '{request_text[:50]}...'")
+        
+        try:
+            if self.provider.lower() == 'gemini':
+                async with self._async_semaphore:
+                    response = await model.generate_content_async(request_text)
+                return self._finish_response(cache_key, response, semantic_key)
             
-        logger.info(f"Sending prompt to {self.provider}: '{enhanced_prompt[:50]}...'")
+            else:
+                return f"Chatbot provider '{self.provider}' logic not implemented."
+
+        except Exception as e:
+            logger.error(f"Error getting response from {self.provider}: {e}", exc_info=True)
+            raise RuntimeError(f"Sorry, an error occurred while contacting the chatbot: {e}")
+
+    def get_response_sync(self, prompt: str, user_id: Optional[str] = None) -> str:
+        """Blocking variant of get_response for synchronous callers such as the Flask views."""
+        if not self.is_enabled():
+            return "Sorry, the chatbot is not configured or enabled."
+
+        model, request_text, cache_key = self._prepare_request(prompt, user_id)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Returning cached chatbot response.")
+            return cached
+        cached, semantic_key = self._semantic_lookup(prompt, cache_key)
+        if cached is not None:
+            logger.info("Returning semantically cached chatbot response.")
+            return cached
+
+        logger.info(f"Sending prompt to {self.provider}: '{request_text[:50]}...'")
         
         try:
             if self.provider.lower() == 'gemini':
-                response = self.model.generate_content(enhanced_prompt)
-                if not response.parts:
-                     logger.warning("Gemini response has no parts (potentially blocked).")
-                     if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
-                          logger.warning(f"Prompt Feedback: {response.prompt_feedback}")
-                     return "Sorry, I couldn't generate a response for that (it might have been blocked)."
-                return response.text
+                with self._sync_semaphore:
+                    response = model.generate_content(request_text)
+                return self._finish_response(cache_key, response, semantic_key)
             
             else:
                 return f"Chatbot provider '{self.provider}' logic not implemented."
@@ -135,18 +578,148 @@ class ChatbotClient:
             logger.error(f"Error getting response from {self.provider}: {e}", exc_info=True)
             raise RuntimeError(f"Sorry, an error occurred while contacting the chatbot: {e}")
 
+    async def stream_response_async(self, prompt: str, user_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Like get_response, but yields the answer in pieces as Gemini generates it."""
+        if not self.is_enabled():
+            yield "Sorry, the chatbot is not configured or enabled."
+            return
+
+        model, request_text, cache_key = await asyncio.to_thread(self._prepare_request, prompt, user_id)
+        cached = self._response_cache.get(cache_key)
+        if cached is None:
+            cached, semantic_key = await asyncio.to_thread(self._semantic_lookup, prompt, cache_key)
+        if cached is not None:
+            logger.info("Returning cached chatbot response.")
+            yield cached
+            return
+        if self.provider.lower() != 'gemini':
+            yield f"Chatbot provider '{self.provider}' logic not implemented."
+            return
+
+        logger.info(f"Streaming prompt to {self.provider}: '{request_text[:50]}...'")
+        pieces = []
+        try:
+            # The semaphore only covers issuing the request, so a slow consumer of the
+            # pieces doesn't keep other requests waiting
+            async with self._async_semaphore:
+                response = await model.generate_content_async(request_text, stream=True)
+            async for chunk in response:
+                if chunk.parts:
+                    pieces.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Error streaming response from {self.provider}: {e}", exc_info=True)
+            raise RuntimeError(f"Sorry, an error occurred while contacting the chatbot: {e}")
+
+        if pieces:
+            self._remember(cache_key, "".join(pieces), semantic_key)
+        else:
+            logger.warning("Gemini streamed no text (potentially blocked).")
+            yield BLOCKED_RESPONSE
+
+    def stream_response(self, prompt: str, user_id: Optional[str] = None) -> Iterator[str]:
+        """Blocking variant of stream_response_async for synchronous callers such as the Flask views."""
+        if not self.is_enabled():
+            yield "Sorry, the chatbot is not configured or enabled."
+            return
+
+        model, request_text, cache_key = self._prepare_request(prompt, user_id)
+        cached = self._response_cache.get(cache_key)
+        if cached is None:
+            cached, semantic_key = self._semantic_lookup(prompt, cache_key)
+        if cached is not None:
+            logger.info("Returning cached chatbot response.")
+            yield cached
+            return
+        if self.provider.lower() != 'gemini':
+            yield f"Chatbot provider '{self.provider}' logic not implemented."
+            return
+
+        logger.info(f"Streaming prompt to {self.provider}: '{request_text[:50]}...'")
+        pieces = []
+        try:
+            # As in stream_response_async, the semaphore is not held across yields
+            with self._sync_semaphore:
+                response = model.generate_content(request_text, stream=True)
+            for chunk in response:
+                if chunk.parts:
+                    pieces.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Error streaming response from {self.provider}: {e}", exc_info=True)
+            raise RuntimeError(f"Sorry, an error occurred while contacting the chatbot: {e}")
+
+        if pieces:
+            self._remember(cache_key, "".join(pieces), semantic_key)
+        else:
+            logger.warning("Gemini streamed no text (potentially blocked).")
+            yield BLOCKED_RESPONSE
+
+    async def get_responses_parallel(self, pairs: List[Tuple[str, Optional[str]]]) -> List[Any]:
+        """Answers independent (prompt, user_id) pairs concurrently, in order.
+
+        At most chatbot_max_concurrency requests are in flight at once. A failed request
+        yields its exception in place of the answer instead of cancelling the others.
+        """
+        return await asyncio.gather(*(self.get_response(prompt, user_id) for prompt, user_id in pairs),
+                                    return_exceptions=True)
+
+    async def get_responses_batch(self, items: List[Tuple[str, Optional[str]]]) -> List[str]:
+        """Answers several (prompt, user_id) pairs, in order.
+
+        Each user's questions share that user's document context, so they are sent together
+        in one request and the model returns a JSON array with one answer per question.
+        """
+        by_user: Dict[Optional[str], List[int]] = {}
+        for index, (_, user_id) in enumerate(items):
+            by_user.setdefault(user_id, []).append(index)
+
+        results: List[str] = [""] * len(items)
+
+        async def answer(user_id: Optional[str], indexes: List[int]):
+            answers = await self._answer_batch([items[i][0] for i in indexes], user_id)
+            for i, text in zip(indexes, answers):
+                results[i] = text
+
+        await asyncio.gather(*(
+            answer(user_id, indexes[start:start + BATCH_MAX_SIZE])
+            for user_id, indexes in by_user.items()
+            for start in range(0, len(indexes), BATCH_MAX_SIZE)
+        ))
+        return results
+
+    async def _answer_batch(self, prompts: List[str], user_id: Optional[str]) -> List[str]:
+        """Answers one user's questions with a single request, falling back to one request per question."""
+        if len(prompts) > 1 and self.is_enabled() and self.provider.lower() == 'gemini':
+            numbered = "\n".join(f"{n}. {prompt}" for n, prompt in enumerate(prompts, 1))
+            batch_prompt = (f"Answer each question below. Return a JSON array of {len(prompts)} strings, "
+                            f"one answer per question, in the same order.\n{numbered}")
+            model, request_text, _ = await asyncio.to_thread(self._prepare_request, batch_prompt, user_id)
+            logger.info(f"Sending {len(prompts)} batched questions to {self.provider}.")
+            try:
+                async with self._async_semaphore:
+                    response = await model.generate_content_async(
+                        request_text, generation_config={'response_mime_type': 'application/json'})
+                answers = json.loads(response.text)
+                if isinstance(answers, list) and len(answers) == len(prompts):
+                    return [str(text) for text in answers]
+                logger.warning("Batched response does not match the questions asked, answering them one by one.")
+            except Exception as e:
+                # Also covers blocked responses, whose .text raises
+                logger.warning(f"Batched request failed, answering the questions one by one: {e}")
+        return list(await asyncio.gather(*(self.get_response(prompt, user_id) for prompt in prompts)))
+
 async def main_test():
     print("Testing ChatbotClient...")
     client = ChatbotClient()
     if client.is_enabled():
         test_prompt = "Explain what this Amazing Storage System does in one sentence."
         print(f"Sending prompt: {test_prompt}")
-        response = client.get_response(test_prompt)
+        response = await client.get_response(test_prompt)
         print(f"Received response: {response}")
     else:
         print("Chatbot is not enabled.")
 
 if __name__ == '__main__':
-    import asyncio
     logging.basicConfig(level=logging.INFO)
     asyncio.run(main_test())
\ No newline at end of file
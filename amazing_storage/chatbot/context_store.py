@@ -0,0 +1,87 @@
+"""
+Storage for the set of files each user has in their chatbot context.
+
+By default the sets live in process memory. When a Redis URL is configured they are
+kept in Redis instead, so several bot/web workers share (and survive restarts with)
+the same per-user context.
+"""
+
+import logging
+import threading
+from typing import Dict, FrozenSet, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class MemoryFileSets:
+    """Per-user sets of active file IDs held in this process."""
+
+    def __init__(self):
+        self._sets: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id: str, file_id: str):
+        with self._lock:
+            self._sets.setdefault(user_id, set()).add(file_id)
+
+    def remove(self, user_id: str, file_id: str) -> bool:
+        with self._lock:
+            files = self._sets.get(user_id)
+            if files and file_id in files:
+                files.remove(file_id)
+                return True
+        return False
+
+    def members(self, user_id: str) -> FrozenSet[str]:
+        with self._lock:
+            return frozenset(self._sets.get(user_id, ()))
+
+    def clear(self, user_id: str) -> int:
+        with self._lock:
+            return len(self._sets.pop(user_id, ()))
+
+
+class RedisFileSets:
+    """Per-user sets of active file IDs stored as Redis sets (SADD/SREM/SMEMBERS)."""
+
+    KEY_PREFIX = "ass:user_files:"
+
+    def __init__(self, client):
+        self.client = client
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+
+    def add(self, user_id: str, file_id: str):
+        self.client.sadd(self._key(user_id), file_id)
+
+    def remove(self, user_id: str, file_id: str) -> bool:
+        return self.client.srem(self._key(user_id), file_id) > 0
+
+    def members(self, user_id: str) -> FrozenSet[str]:
+        return frozenset(self.client.smembers(self._key(user_id)))
+
+    def clear(self, user_id: str) -> int:
+        pipe = self.client.pipeline()
+        pipe.scard(self._key(user_id))
+        pipe.delete(self._key(user_id))
+        count, _ = pipe.execute()
+        return count
+
+
+def create_file_sets(redis_url: Optional[str] = None):
+    """Returns a Redis-backed store if redis_url is set and reachable, otherwise an in-memory one."""
+    if not redis_url:
+        return MemoryFileSets()
+    try:
+        import redis
+    except ImportError:
+        logger.warning("redis_url is configured but the 'redis' package is not installed. Using in-memory file contexts.")
+        return MemoryFileSets()
+    try:
+        client = redis.Redis.from_url(redis_url, decode_responses=True)
+        client.ping()
+        logger.info("Chatbot file contexts are stored in Redis.")
+        return RedisFileSets(client)
+    except Exception as e:
+        logger.error(f"Could not connect to Redis, using in-memory file contexts: {e}")
+        return MemoryFileSets()
@@ -0,0 +1,66 @@
+"""
+Semantic response cache for the chatbot.
+
+Answers are stored per user next to the embedding of the question that produced them.
+A later question whose embedding is close enough (cosine similarity at or above the
+threshold) and that was asked over the same document context reuses the stored answer.
+"""
+
+import math
+import operator
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+def _normalize(vector: Sequence[float]) -> Tuple[float, ...]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        return tuple(vector)
+    return tuple(x / norm for x in vector)
+
+class SemanticCache:
+    """Per-user LRU of (normalized embedding, context signature) -> answer."""
+
+    def __init__(self, threshold: float = 0.9, maxsize: int = 256):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._entries: Dict[str, "OrderedDict[int, Tuple[Tuple[float, ...], Hashable, str]]"] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, embedding: Sequence[float], context: Hashable) -> Optional[str]:
+        """Returns the answer to the most similar earlier question over the same context, if similar enough."""
+        query = _normalize(embedding)
+        with self._lock:
+            entries = self._entries.get(user_id)
+            if not entries:
+                return None
+            best_id, best_score = None, self.threshold
+            for entry_id, (vector, entry_context, _) in entries.items():
+                if entry_context != context:
+                    continue
+                score = sum(map(operator.mul, query, vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                return None
+            entries.move_to_end(best_id)
+            return entries[best_id][2]
+
+    def put(self, user_id: str, embedding: Sequence[float], context: Hashable, answer: str):
+        """Stores an answer, evicting the user's least recently used entry when full."""
+        vector = _normalize(embedding)
+        with self._lock:
+            entries = self._entries.setdefault(user_id, OrderedDict())
+            entries[self._next_id] = (vector, context, answer)
+            self._next_id += 1
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+
+    def clear(self, user_id: Optional[str] = None):
+        """Drops the cached answers of one user, or of everyone."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
@@ -1,15 +1,38 @@
 import os
 import json
 import logging
-from typing import List, Dict, Optional, Union, Any
+import functools
+from typing import List, Dict, Optional, Union, Any, Tuple
 from dataclasses import dataclass, field
 
+try:
+    import orjson # Optional: faster config parsing
+except ImportError:
+    orjson = None
+
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 CONFIG_FILE = "config.json"
 
+# path -> ((mtime_ns, size), parsed data); lets repeated loads skip re-reading an unchanged file
+_config_data_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+def _read_config_file(path: str) -> Dict[str, Any]:
+    """Reads and parses a JSON config file, reusing the last parse while the file is unchanged."""
+    st = os.stat(path)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    cached = _config_data_cache.get(path)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        raw = f.read()
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers handle both the same way
+    config_data = orjson.loads(raw) if orjson else json.loads(raw)
+    _config_data_cache[path] = (stat_key, config_data)
+    return config_data
+
 def mask_sensitive_value(value: str) -> str:
     """Mask sensitive values for logging."""
     if not value or len(value) < 8:
@@ -26,15 +49,30 @@ class BucketConfig:
 @dataclass
 class AppConfig:
     buckets: List[BucketConfig] = field(default_factory=list)
-    chunk_size: int = 5 * 1024 * 1024
+    chunk_size: int = 5 * 1024 * 1024 # Also the smallest chunk size picked for a file
+    max_chunk_size: int = 32 * 1024 * 1024 # Large files grow their chunks up to this; set to chunk_size to disable
+    upload_concurrency: int = 8 # Chunks uploaded in parallel
+    download_concurrency: int = 8 # Chunks downloaded in parallel
+    integrity_algorithm: Optional[str] = None # Chunk hash: "blake3" or "sha256" (default: blake3 if installed)
     encryption_enabled: bool = False
     encryption_key: Optional[str] = None
     performance_monitoring: bool = False
     web_interface_host: str = "127.0.0.1"
     web_interface_port: int = 5000
     telegram_bot_token: Optional[str] = None
+    telegram_webhook_url: Optional[str] = None # Public HTTPS URL; when set the bot uses a webhook instead of polling
+    telegram_webhook_listen: str = "0.0.0.0"
+    telegram_webhook_port: int = 8443
+    telegram_webhook_secret: Optional[str] = None
     chatbot_api_key: Optional[str] = None
     chatbot_provider: Optional[str] = None
+    chatbot_max_concurrency: int = 8
+    chatbot_debounce_seconds: float = 2.0 # Pause that ends a burst of quick messages, which then get one combined answer (0 disables)
+    redis_url: Optional[str] = None # Optional shared store for per-user chatbot file contexts
+    chatbot_semantic_cache_threshold: Optional[float] = None # e.g. 0.9 reuses answers to near-identical questions (unset disables)
+    chatbot_context_budget_tokens: Optional[int] = 128000 # Approximate cap on document context per prompt (0 disables)
+    chatbot_context_policy: str = "prune" # What happens to older documents over the budget: "prune" or "summarize"
+    chatbot_max_users: int = 1024 # Users whose document text is kept in memory (least recently active are evicted)
     dropbox_app_key: Optional[str] = None
     dropbox_app_secret: Optional[str] = None
     dropbox_redirect_uri: Optional[str] = None
@@ -43,8 +81,7 @@ class AppConfig:
     def load(cls, path: str = CONFIG_FILE) -> 'AppConfig':
         """Loads configuration from JSON and environment variables."""
         try:
-            with open(path, 'r') as f:
-                config_data = json.load(f)
+            config_data = _read_config_file(path)
             logger.info(f"Configuration loaded from {path}")
         except FileNotFoundError:
             logger.warning(f"Configuration file '{path}' not found. Using defaults.")
@@ -62,23 +99,40 @@ class AppConfig:
         except ImportError:
             logger.info("python-dotenv not installed, skipping .env file loading")
 
+        # One snapshot (taken after .env is applied) serves every lookup below
+        env = dict(os.environ)
         env_prefix = "ASS_"
         env_vars = {
             "ENCRYPTION_KEY": "encryption_key",
             "TELEGRAM_BOT_TOKEN": "telegram_bot_token",
+            "TELEGRAM_WEBHOOK_URL": "telegram_webhook_url",
+            "TELEGRAM_WEBHOOK_LISTEN": "telegram_webhook_listen",
+            "TELEGRAM_WEBHOOK_PORT": "telegram_webhook_port",
+            "TELEGRAM_WEBHOOK_SECRET": "telegram_webhook_secret",
             "CHATBOT_API_KEY": "chatbot_api_key",
             "DROPBOX_APP_KEY": "dropbox_app_key",
             "DROPBOX_APP_SECRET": "dropbox_app_secret",
             "DROPBOX_REDIRECT_URI": "dropbox_redirect_uri",
             "WEB_HOST": "web_interface_host",
             "WEB_PORT": "web_interface_port",
-            "CHUNK_SIZE": "chunk_size"
+            "CHUNK_SIZE": "chunk_size",
+            "MAX_CHUNK_SIZE": "max_chunk_size",
+            "UPLOAD_CONCURRENCY": "upload_concurrency",
+            "DOWNLOAD_CONCURRENCY": "download_concurrency",
+            "INTEGRITY_ALGORITHM": "integrity_algorithm",
+            "CHATBOT_MAX_CONCURRENCY": "chatbot_max_concurrency",
+            "CHATBOT_DEBOUNCE_SECONDS": "chatbot_debounce_seconds",
+            "REDIS_URL": "redis_url",
+            "CHATBOT_SEMANTIC_CACHE_THRESHOLD": "chatbot_semantic_cache_threshold",
+            "CHATBOT_CONTEXT_BUDGET_TOKENS": "chatbot_context_budget_tokens",
+            "CHATBOT_CONTEXT_POLICY": "chatbot_context_policy",
+            "CHATBOT_MAX_USERS": "chatbot_max_users"
         }
 
         bucket_configs = []
         for i, bucket_data in enumerate(config_data.get("buckets", [])):
             # Get credential filename from environment or config file
-            env_cred = os.getenv(f'{env_prefix}CREDENTIALS_{i}')
+            env_cred = env.get(f'{env_prefix}CREDENTIALS_{i}')
             base_cred = bucket_data.get('credentials')
             credentials = env_cred if env_cred is not None else base_cred
 
@@ -100,14 +154,24 @@ class AppConfig:
         config.buckets = bucket_configs
 
         config.chunk_size = config_data.get("chunk_size", config.chunk_size)
+        config.max_chunk_size = config_data.get("max_chunk_size", config.max_chunk_size)
+        config.upload_concurrency = config_data.get("upload_concurrency", config.upload_concurrency)
+        config.download_concurrency = config_data.get("download_concurrency", config.download_concurrency)
         config.encryption_enabled = config_data.get("encryption_enabled", config.encryption_enabled)
         config.performance_monitoring = config_data.get("performance_monitoring", config.performance_monitoring)
         config.web_interface_host = config_data.get("web_interface_host", config.web_interface_host)
         config.web_interface_port = config_data.get("web_interface_port", config.web_interface_port)
         config.chatbot_provider = config_data.get("chatbot_provider", config.chatbot_provider)
+        config.telegram_webhook_listen = config_data.get("telegram_webhook_listen", config.telegram_webhook_listen)
+        config.telegram_webhook_port = config_data.get("telegram_webhook_port", config.telegram_webhook_port)
+        config.chatbot_max_concurrency = config_data.get("chatbot_max_concurrency", config.chatbot_max_concurrency)
+        config.chatbot_debounce_seconds = config_data.get("chatbot_debounce_seconds", config.chatbot_debounce_seconds)
+        config.chatbot_context_budget_tokens = config_data.get("chatbot_context_budget_tokens", config.chatbot_context_budget_tokens)
+        config.chatbot_context_policy = config_data.get("chatbot_context_policy", config.chatbot_context_policy)
+        config.chatbot_max_users = config_data.get("chatbot_max_users", config.chatbot_max_users)
 
         for env_name, attr_name in env_vars.items():
-            env_value = os.getenv(f"{env_prefix}{env_name}")
+            env_value = env.get(f"{env_prefix}{env_name}")
             if env_value is not None:
                 setattr(config, attr_name, env_value)
                 if any(keyword in attr_name for keyword in ['key', 'secret', 'token', 'password']):
@@ -135,10 +199,19 @@ class AppConfig:
         logger.info(f"Dropbox OAuth: redirect_uri={config.dropbox_redirect_uri}")
         return config
 
-# Singleton instance
-app_config = AppConfig.load()
+@functools.lru_cache(maxsize=1)
+def get_config() -> AppConfig:
+    """Returns the application configuration, loading it on first use."""
+    return AppConfig.load()
+
+def __getattr__(name: str):
+    # Backward compatibility: `app_config` used to be loaded at import time
+    if name == "app_config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
+    app_config = get_config()
     print("Loaded Configuration:")
     print(f"Chunk Size: {app_config.chunk_size}")
     print(f"Encryption Enabled: {app_config.encryption_enabled}")
@@ -0,0 +1,104 @@
+"""
+In-process caching helpers for the Amazing Storage System.
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple, TypeVar
+
+_MISSING = object()
+
+T = TypeVar("T")
+
+def single_instance(factory: Callable[[], T]) -> Callable[[], T]:
+    """
+    Wraps a no-argument factory so its result is built once and then shared.
+
+    Unlike functools.lru_cache, threads that call it at the same time wait for the
+    first build instead of each building their own instance.
+    """
+    lock = threading.Lock()
+    instance = _MISSING
+
+    @functools.wraps(factory)
+    def get() -> T:
+        nonlocal instance
+        if instance is _MISSING:
+            with lock:
+                if instance is _MISSING:
+                    instance = factory()
+        return instance
+    return get
+
+class LRUCache:
+    """
+    A thread-safe mapping that keeps at most `maxsize` entries, evicting the least recently used.
+
+    If `ttl` (seconds) is given, entries also expire that long after they were stored.
+    If `maxweight` is given, the summed `weigh(value)` of all entries is kept at or below it too
+    (an entry heavier than `maxweight` on its own is not kept).
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None,
+                 maxweight: Optional[int] = None, weigh: Callable[[Any], int] = len):
+        if maxsize <= 0:
+            raise ValueError("Cache size must be positive.")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float], int]]" = OrderedDict()  # key -> (value, expires_at, weight)
+        self._weight = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Returns the cached value for key (marking it as recently used) or default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at, weight = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self._weight -= weight
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Stores value under key, evicting the oldest entries if the cache is full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        weight = self.weigh(value) if self.maxweight is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._weight -= old[2]
+            self._data[key] = (value, expires_at, weight)
+            self._weight += weight
+            while self._data and (len(self._data) > self.maxsize
+                                  or (self.maxweight is not None and self._weight > self.maxweight)):
+                self._weight -= self._data.popitem(last=False)[1][2]
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Removes key from the cache and returns its value, or default if absent."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._weight -= entry[2]
+            return entry[0]
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
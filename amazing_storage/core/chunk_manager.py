@@ -1,14 +1,66 @@
+import io
 import os
-import math
+import mmap
 import hashlib
 import time
 import datetime
-from typing import List, Optional, Iterator, Tuple
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, List, Optional, Iterable, Iterator, Tuple, Union
 
-from ..config import app_config
-from ..storage import StorageProvider, get_storage_provider
+try:
+    import blake3 # Optional: SIMD chunk hashing, several times faster than SHA-256
+except ImportError:
+    blake3 = None
+
+from ..config import get_config
+from ..storage import get_storage_provider
 from .metadata import MetadataManager, FileManifest, ChunkInfo
 
+# Chunk hashes made with BLAKE3 are stored with this prefix; untagged hashes are SHA-256
+BLAKE3_PREFIX = "b3:"
+SHA256_PREFIX = "sha256:"
+
+def chunk_digest(data: Union[bytes, memoryview], algorithm: str = "sha256") -> str:
+    """Returns the integrity hash of a chunk as stored in its ChunkInfo."""
+    if algorithm == "blake3":
+        return BLAKE3_PREFIX + blake3.blake3(data).hexdigest()
+    return hashlib.sha256(data).hexdigest()
+
+def chunk_hasher(expected: str):
+    """Returns (incremental hasher, digest prefix) for the algorithm a stored chunk hash was made with."""
+    if expected.startswith(BLAKE3_PREFIX):
+        if blake3 is None:
+            raise ValueError("Chunk was hashed with BLAKE3 but the 'blake3' package is not installed")
+        return blake3.blake3(), BLAKE3_PREFIX
+    if expected.startswith(SHA256_PREFIX):
+        return hashlib.sha256(), SHA256_PREFIX
+    return hashlib.sha256(), ""
+
+# Files at least this large are read through mmap instead of read() calls
+MMAP_MIN_SIZE = 1024 * 1024
+
+# Output directories download_file has already created; a removed one is recreated on the failed open
+_ensured_dirs = set()
+
+def _open_output(output_path: str) -> int:
+    """Opens (creating or truncating) a download target, creating its directory if needed."""
+    directory = os.path.dirname(os.path.abspath(output_path))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    if directory not in _ensured_dirs:
+        os.makedirs(directory, exist_ok=True)
+        _ensured_dirs.add(directory)
+    try:
+        return os.open(output_path, flags, 0o666)
+    except FileNotFoundError:
+        # The directory was removed since it was created
+        os.makedirs(directory, exist_ok=True)
+        return os.open(output_path, flags, 0o666)
+
+# Large files get bigger chunks, aiming for this many per provider (between chunk_size and max_chunk_size)
+CHUNKS_PER_PROVIDER = 8
+
 # Simple round-robin strategy for provider selection
 class RoundRobinStrategy:
     def __init__(self, num_providers: int):
@@ -29,8 +81,20 @@ class ChunkManager:
     def __init__(self, metadata_manager: MetadataManager):
         """Initialize the chunk manager with storage providers from config."""
         self.metadata_manager = metadata_manager
-        self.chunk_size = app_config.chunk_size
+        app_config = get_config()
+        self.chunk_size = int(app_config.chunk_size)
+        self.max_chunk_size = max(self.chunk_size, int(app_config.max_chunk_size or 0))
         self.providers = []
+        # Chunks go to different providers and uploads are network bound, so several run at once
+        # Hash for new chunks; BLAKE3 when available, downloads verify whichever a chunk was stored with
+        self.integrity_algorithm = (app_config.integrity_algorithm or ("blake3" if blake3 else "sha256")).lower()
+        if self.integrity_algorithm not in ("blake3", "sha256") or (self.integrity_algorithm == "blake3" and not blake3):
+            print(f"WARNING: Integrity algorithm '{self.integrity_algorithm}' is not available, using sha256.")
+            self.integrity_algorithm = "sha256"
+        self.upload_concurrency = max(1, int(app_config.upload_concurrency))
+        self._upload_executor = ThreadPoolExecutor(max_workers=self.upload_concurrency, thread_name_prefix="chunk-upload")
+        self.download_concurrency = max(1, int(app_config.download_concurrency))
+        self._download_executor = ThreadPoolExecutor(max_workers=self.download_concurrency, thread_name_prefix="chunk-download")
         
         # Initialize all providers from config
         print("Initializing storage providers for ChunkManager...")
@@ -51,22 +115,49 @@ class ChunkManager:
         # Initialize distribution strategy
         self.distribution_strategy = RoundRobinStrategy(len(self.providers)) if self.providers else None
 
-    def _read_file_in_chunks(self, file_path: str) -> Iterator[bytes]:
-        """Reads a file and yields chunks of data."""
+    def _pick_chunk_size(self, total_size: int) -> int:
+        """Chooses the chunk size for a file of total_size bytes.
+
+        Fewer, larger chunks mean fewer requests and smaller manifests, while about
+        CHUNKS_PER_PROVIDER chunks per provider still keep every upload worker busy.
+        """
+        target = total_size // (max(1, len(self.providers)) * CHUNKS_PER_PROVIDER)
+        return max(self.chunk_size, min(self.max_chunk_size, target))
+
+    def _read_file_in_chunks(self, f: BinaryIO, size: int, chunk_size: int) -> Iterator[Union[bytes, memoryview]]:
+        """Reads an open file of the given size and yields chunks of data (memoryviews into a mapping for large files)."""
         try:
-            with open(file_path, 'rb') as f:
+            if size < MMAP_MIN_SIZE:
                 while True:
-                    chunk = f.read(self.chunk_size)
+                    chunk = f.read(chunk_size)
                     if not chunk:
                         break
                     yield chunk
-        except FileNotFoundError:
-             print(f"Error: Input file not found at {file_path}")
-             raise
+                return
+            # Chunks are views of the mapped pages: hashing and uploading read them without a copy.
+            # The mapping is not closed here, as upload workers may still hold views after the
+            # last chunk is yielded; it is released once the final view is dropped.
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+            for offset in range(0, size, chunk_size):
+                yield view[offset:offset + chunk_size]
         except IOError as e:
-             print(f"Error reading file {file_path}: {e}")
+             print(f"Error reading file {f.name}: {e}")
              raise
 
+    def _rechunk_stream(self, data_stream: Iterable[bytes]) -> Iterator[bytes]:
+        """Regroups arbitrarily sized byte blocks into chunk_size pieces."""
+        buffer = bytearray()
+        for block in data_stream:
+            buffer += block
+            while len(buffer) >= self.chunk_size:
+                yield bytes(buffer[:self.chunk_size])
+                del buffer[:self.chunk_size]
+        if buffer:
+            yield bytes(buffer)
+
     def upload_file(self, file_path: str, original_filename: str = None, file_id: str = None, version_notes: str = "") -> str:
         """
         Split a file into chunks and distribute across providers.
@@ -83,12 +174,48 @@ class ChunkManager:
         if not self.providers:
             raise ValueError("No storage providers are available")
         
-        if not os.path.exists(file_path):
+        # Open once and take the size from the open file: no separate exists/getsize stats
+        try:
+            f = open(file_path, 'rb')
+        except FileNotFoundError:
             raise FileNotFoundError(f"File {file_path} does not exist")
-            
-        if not original_filename:
-            original_filename = os.path.basename(file_path)
-            
+        
+        with f:
+            if not original_filename:
+                original_filename = os.path.basename(file_path)
+
+            # Get file size
+            file_size = os.fstat(f.fileno()).st_size
+            chunk_size = self._pick_chunk_size(file_size)
+            print(f"Starting upload for '{original_filename}' (Size: {file_size / (1024 * 1024):.2f} MB, chunk size: {chunk_size / (1024 * 1024):.2f} MB)")
+
+            return self._upload_chunks(self._read_file_in_chunks(f, file_size, chunk_size), original_filename, file_id, version_notes, chunk_size)
+
+    def upload_stream(self, data_stream: Iterable[bytes], original_filename: str, file_id: str = None, version_notes: str = "") -> str:
+        """
+        Split a stream of byte blocks into chunks and distribute across providers.
+
+        Unlike upload_file, the data never has to be written to local disk first,
+        so callers can pipe a network download straight into the providers.
+
+        Args:
+            data_stream: Iterable yielding the file content as byte blocks of any size
+            original_filename: The original filename
+            file_id: If provided, updates an existing file by creating a new version
+            version_notes: Notes for this version if updating an existing file
+
+        Returns:
+            The file_id of the uploaded file
+        """
+        if not self.providers:
+            raise ValueError("No storage providers are available")
+
+        # The total size isn't known up front, so streams use the base chunk size
+        print(f"Starting streamed upload for '{original_filename}'")
+        return self._upload_chunks(self._rechunk_stream(data_stream), original_filename, file_id, version_notes, self.chunk_size)
+
+    def _upload_chunks(self, chunk_stream: Iterable[bytes], original_filename: str, file_id: Optional[str], version_notes: str, chunk_size: int) -> str:
+        """Uploads each chunk yielded by chunk_stream and records them as a new file version."""
         existing_manifest = None
         if file_id:
             existing_manifest = self.metadata_manager.load_manifest(file_id)
@@ -100,84 +227,84 @@ class ChunkManager:
         if not file_id:
             file_id = self.metadata_manager.generate_file_id()
         
-        # Get file size
-        file_size = os.path.getsize(file_path)
+        print(f"Uploading '{original_filename}' as File ID: {file_id}")
         
-        # Create a new manifest or use existing one
-        if existing_manifest:
-            manifest = existing_manifest
-        else:
-            manifest = FileManifest(
-                file_id=file_id,
-                original_filename=original_filename,
-                total_size=file_size,
-                chunk_size=self.chunk_size,
-            )
-        
-        print(f"Starting upload for '{original_filename}' (Size: {file_size / (1024 * 1024):.2f} MB, File ID: {file_id})")
-        
-        uploaded_chunks = []
+        chunks = []
+        pending = deque()
         
         try:
-            # Read file and split into chunks
-            chunks = []
-            # Use binary mode and close the file properly
-            with open(file_path, 'rb') as f:
-                chunk_idx = 0
-                
-                while True:
-                    chunk_data = f.read(self.chunk_size)
-                    if not chunk_data:
-                        break  # End of file
-                        
-                    chunk_hash = hashlib.sha256(chunk_data).hexdigest()
-                    
-                    provider_idx = chunk_idx % len(self.providers)
-                    provider = self.providers[provider_idx]
-                    chunk_name = f"{file_id}_chunk_{chunk_idx}_{int(time.time())}"
-                    
-                    print(f"  Uploading chunk {chunk_idx} ({len(chunk_data)} bytes, hash: {chunk_hash[:8]}...) to provider {provider_idx} ({provider.__class__.__name__}) as '{chunk_name}'")
-                    try:
-                        chunk_id = provider.upload_chunk(chunk_data, chunk_name)
-                        uploaded_chunks.append((provider_idx, chunk_id))
-                        
-                        chunk_info = ChunkInfo(
-                            chunk_index=chunk_idx,
-                            size=len(chunk_data),
-                            hash=chunk_hash,
-                            provider_index=provider_idx,
-                            chunk_id=chunk_id
-                        )
-                        chunks.append(chunk_info)
-                        
-                        chunk_idx += 1
-                    except Exception as e:
-                        print(f"Error uploading chunk {chunk_idx}: {e}")
-                        # Ensure cleanup before raising
-                        self._cleanup_failed_upload(uploaded_chunks)
-                        raise
+            for chunk_idx, chunk_data in enumerate(chunk_stream):
+                provider_idx = chunk_idx % len(self.providers)
+                pending.append(self._upload_executor.submit(
+                    self._upload_chunk, file_id, chunk_idx, chunk_data, provider_idx))
+                # Backpressure: don't read further ahead of the uploads than two chunks per worker
+                while len(pending) >= 2 * self.upload_concurrency:
+                    chunks.append(pending.popleft().result())
+            while pending:
+                chunks.append(pending.popleft().result())
+            chunks.sort(key=lambda chunk: chunk.chunk_index)
+            total_size = sum(chunk.size for chunk in chunks)
             
             # Add a new version with these chunks
             if existing_manifest:
+                manifest = existing_manifest
+                manifest.total_size = total_size
+                manifest.chunk_size = chunk_size
                 version_notes = version_notes or f"Updated {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                 manifest.add_version(chunks, notes=version_notes)
                 print(f"Added new version for '{original_filename}' with {len(chunks)} chunks.")
             else:
+                manifest = FileManifest(
+                    file_id=file_id,
+                    original_filename=original_filename,
+                    total_size=total_size,
+                    chunk_size=chunk_size,
+                )
                 # For new files, the first version is created implicitly
                 manifest.add_version(chunks, notes="Initial version")
             
             # Save the manifest after all chunks are uploaded
             self.metadata_manager.save_manifest(manifest)
-            print(f"Successfully {'updated' if existing_manifest else 'uploaded'} '{original_filename}' with {len(chunks)} chunks. Manifest saved.")
+            print(f"Successfully {'updated' if existing_manifest else 'uploaded'} '{original_filename}' with {len(chunks)} chunks ({total_size / (1024 * 1024):.2f} MB). Manifest saved.")
             
             return file_id
             
         except Exception as e:
             print(f"Error during upload of '{original_filename}': {e}")
+            # Stop uploads that haven't started and wait for the running ones, so their chunks are cleaned up too
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    chunks.append(future.result())
             # Clean up any chunks that were uploaded before the error
-            self._cleanup_failed_upload(uploaded_chunks)
+            self._cleanup_failed_upload([(chunk.provider_index, chunk.chunk_id) for chunk in chunks])
             raise # Re-raise the exception
 
+    def _upload_chunk(self, file_id: str, chunk_idx: int, chunk_data: Union[bytes, memoryview], provider_idx: int) -> ChunkInfo:
+        """Hashes and uploads one chunk (runs on the upload pool).
+
+        Hashing releases the GIL, so this overlaps with reading the next
+        chunks and with the network waits of other uploads.
+        """
+        chunk_hash = chunk_digest(chunk_data, self.integrity_algorithm)
+        provider = self.providers[provider_idx]
+        chunk_name = f"{file_id}_chunk_{chunk_idx}_{int(time.time())}"
+        
+        print(f"  Uploading chunk {chunk_idx} ({len(chunk_data)} bytes, hash: {chunk_hash[:8]}...) to provider {provider_idx} ({provider.__class__.__name__}) as '{chunk_name}'")
+        try:
+            chunk_id = provider.upload_chunk(chunk_data, chunk_name)
+        except Exception as e:
+            print(f"Error uploading chunk {chunk_idx}: {e}")
+            raise
+        return ChunkInfo(
+            chunk_index=chunk_idx,
+            size=len(chunk_data),
+            hash=chunk_hash,
+            provider_index=provider_idx,
+            chunk_id=chunk_id
+        )
+
     def _cleanup_failed_upload(self, uploaded_chunks: List[Tuple[int, str]]):
         """Attempts to delete chunks uploaded before a failure occurred."""
         if not uploaded_chunks:
@@ -204,36 +331,108 @@ class ChunkManager:
         Returns:
             True if successful, raises exception otherwise
         """
+        chunks = self._load_chunks(file_id)
+            
+        # Create output directory if needed
+        fd = _open_output(output_path)
+        try:
+            self._download_chunks_into(chunks, fd)
+        finally:
+            os.close(fd)
+        
+        return True
+
+    def download_to_buffer(self, file_id: str):
+        """
+        Download and reconstruct a file in memory, without writing it to disk.
+        
+        The chunks go into an anonymous memory file (memfd on Linux, a temporary file
+        elsewhere) that is mapped read-only.
+        
+        Returns:
+            A seekable binary file-like object (an mmap, or an empty BytesIO for empty
+            files) positioned at the start. The caller closes it.
+        """
+        chunks = self._load_chunks(file_id)
+        if not chunks:
+            return io.BytesIO()
+        
+        if hasattr(os, "memfd_create"):
+            fd = os.memfd_create("ass_download", getattr(os, "MFD_CLOEXEC", 0))
+        else:
+            with tempfile.TemporaryFile() as tmp:
+                fd = os.dup(tmp.fileno())
+        try:
+            self._download_chunks_into(chunks, fd)
+            if not os.fstat(fd).st_size:
+                return io.BytesIO() # Empty files can't be mapped
+            # The mapping keeps its own reference to the file, so fd can be closed right away
+            return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+    def _load_chunks(self, file_id: str) -> List[ChunkInfo]:
+        """Returns a file's chunks in order, checking that every provider they reference exists."""
         # Load the manifest
         manifest = self.metadata_manager.load_manifest(file_id)
         if not manifest:
             raise FileNotFoundError(f"No manifest found for file {file_id}")
-            
-        # Create output directory if needed
-        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
         
-        # Open output file
-        with open(output_path, 'wb') as f:
-            # Download each chunk in order
-            for chunk_info in sorted(manifest.chunks, key=lambda x: x.chunk_index):
-                # Get the appropriate provider
-                if chunk_info.provider_index >= len(self.providers):
-                    raise ValueError(f"Provider index {chunk_info.provider_index} out of range")
-                    
-                provider = self.providers[chunk_info.provider_index]
-                
-                # Download the chunk
-                chunk_data = provider.download_chunk(chunk_info.chunk_id)
-                
-                # Verify hash
-                chunk_hash = hashlib.sha256(chunk_data).hexdigest()
-                if chunk_hash != chunk_info.hash:
-                    raise ValueError(f"Chunk {chunk_info.chunk_index} hash mismatch: expected {chunk_info.hash}, got {chunk_hash}")
-                
-                # Write to file
-                f.write(chunk_data)
+        chunks = sorted(manifest.chunks, key=lambda x: x.chunk_index)
+        for chunk_info in chunks:
+            if chunk_info.provider_index >= len(self.providers):
+                raise ValueError(f"Provider index {chunk_info.provider_index} out of range")
+        return chunks
+
+    def _download_chunks_into(self, chunks: List[ChunkInfo], fd: int):
+        """Downloads chunks concurrently into their regions of the file open on fd."""
+        if any(chunk_info.size <= 0 for chunk_info in chunks):
+            # Manifests written before chunk sizes were recorded: offsets can't be precomputed,
+            # so append the chunks one after another instead
+            offset = 0
+            for chunk_info in chunks:
+                offset += self._download_chunk_into(chunk_info, fd, offset)
+            return
         
-        return True
+        # Every chunk's place in the file is known up front, so chunks are downloaded concurrently and
+        # streamed straight into their own region of the preallocated file, never buffered whole
+        futures = []
+        try:
+            os.ftruncate(fd, sum(chunk_info.size for chunk_info in chunks))
+            offset = 0
+            for chunk_info in chunks:
+                futures.append(self._download_executor.submit(self._download_chunk_into, chunk_info, fd, offset))
+                offset += chunk_info.size
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            # Running downloads still write to fd; let them finish before the caller closes it
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+
+    def _download_chunk_into(self, chunk_info: ChunkInfo, fd: int, offset: int) -> int:
+        """Downloads one chunk into its region of the output file and verifies its hash (runs on the download pool).
+
+        Returns the number of bytes written.
+        """
+        provider = self.providers[chunk_info.provider_index]
+        hasher, prefix = chunk_hasher(chunk_info.hash or "")
+        
+        # Download the chunk
+        written = provider.download_chunk_into(chunk_info.chunk_id, fd, offset, hasher)
+        if chunk_info.size > 0 and written != chunk_info.size:
+            raise ValueError(f"Chunk {chunk_info.chunk_index} size mismatch: expected {chunk_info.size} bytes, got {written}")
+        
+        # Verify hash
+        chunk_hash = prefix + hasher.hexdigest()
+        if chunk_hash != chunk_info.hash:
+            raise ValueError(f"Chunk {chunk_info.chunk_index} hash mismatch: expected {chunk_info.hash}, got {chunk_hash}")
+        return written
 
     def delete_file(self, file_id: str) -> bool:
         """
@@ -1,74 +1,198 @@
+import io
 import os
-import tempfile
 import logging
 import mimetypes
 import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import PyPDF2
 import docx
-from typing import Dict, Optional, Tuple
+
+from typing import BinaryIO, Optional, Tuple, Union
+
+try:
+    import pypdfium2 # Optional: PDFium (C++) text extraction, much faster than PyPDF2
+except ImportError:
+    pypdfium2 = None
 
 from ..core.metadata import MetadataManager
 from ..core.chunk_manager import ChunkManager
+from ..core.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# PDFium is not thread-safe; pypdfium2 requires callers to serialize every call into it.
+# Each worker process has its own PDFium and runs one task at a time, so only this process needs it.
+_PDFIUM_LOCK = threading.Lock()
+
+# Extracted text kept in memory; evicted texts are reloaded from the copy saved next to the manifest
+CONTENT_CACHE_SIZE = 256 # Number of documents
+CONTENT_CACHE_CHARS = 64 * 1024 * 1024 # Total characters across all documents
+
+# Large PDFs are split across worker processes: PyPDF2 is GIL-bound, and PDFium calls
+# have to be serialized within a process
+PARALLEL_PDF_MIN_BYTES = 2 * 1024 * 1024 # Smaller documents aren't worth handing to the pool
+PDF_WORKERS = min(4, os.cpu_count() or 1) # Shared by every caller, so the total is bounded
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Returns the shared PDF worker pool, creating it on first use.
+
+    Workers come from a forkserver (spawn where unavailable), never a fork of this
+    multithreaded process, which could inherit locks held by other threads.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pdf_pool
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor):
+    """Drops a broken pool so the next caller starts a fresh one."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+def _page_range(page_count: int, part: int, parts: int) -> range:
+    """The pages of one of `parts` contiguous, near-equal slices of a document."""
+    step = -(-page_count // parts)
+    return range(part * step, min((part + 1) * step, page_count))
+
+def _pdfium_text(source: Union[str, bytes, BinaryIO], part: int = 0, parts: int = 1) -> str:
+    """Extracts the text of a slice of a PDF with pypdfium2 (every page by default)."""
+    pdf = pypdfium2.PdfDocument(source)
+    try:
+        texts = []
+        for index in _page_range(len(pdf), part, parts):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range() + "\n")
+            textpage.close()
+            page.close()
+        return "".join(texts)
+    finally:
+        pdf.close()
+
+def _pypdf2_text(source: Union[str, BinaryIO], part: int = 0, parts: int = 1) -> str:
+    """Extracts the text of a slice of a PDF with PyPDF2 (every page by default)."""
+    reader = PyPDF2.PdfReader(source)
+    # One join instead of growing a string page by page; each page still ends with a newline
+    return "".join((reader.pages[index].extract_text() or "") + "\n"
+                   for index in _page_range(len(reader.pages), part, parts))
+
+def _extract_pdf_part(data: bytes, part: int, parts: int, use_pdfium: bool) -> str:
+    """Extracts one slice of a PDF in a worker process.
+
+    The worker counts the pages itself, so the parent never has to parse the document.
+    """
+    if use_pdfium:
+        return _pdfium_text(data, part, parts)
+    return _pypdf2_text(io.BytesIO(data), part, parts)
+
 class FileProcessor:
     """Processes files to extract text content for LLM context."""
 
     def __init__(self, metadata_manager: MetadataManager, chunk_manager: ChunkManager):
         self.metadata_manager = metadata_manager
         self.chunk_manager = chunk_manager
-        self.file_content_cache: Dict[str, str] = {}
+        self.file_content_cache = LRUCache(maxsize=CONTENT_CACHE_SIZE, maxweight=CONTENT_CACHE_CHARS,
+                                           weigh=lambda entry: len(entry[1]))  # file_id -> (version_id, text)
 
-    def extract_text_from_file(self, file_path: str) -> str:
-        """Extract text content from a file based on its type."""
+    def is_supported(self, file_path: str) -> bool:
+        """Whether text can be extracted from a file of this name's type."""
         mime_type, _ = mimetypes.guess_type(file_path)
-        
+        return (file_path.lower().endswith(('.pdf', '.docx', '.doc'))
+                or bool(mime_type and mime_type.startswith('text/')))
+
+    def extract_text_from_file(self, file_path: str, stream: Optional[BinaryIO] = None) -> str:
+        """Extract text content from a file based on its type.
+
+        If a seekable binary stream is given, the content is read from it and file_path
+        is only used to tell the type. Failures are returned as a message, not raised.
+        """
+        if not self.is_supported(file_path):
+            # For now, just return a message for unsupported file types
+            logger.warning(f"Unsupported file type for {file_path}")
+            return self._unsupported_message(file_path)
         try:
-            # Handle PDFs
-            if file_path.lower().endswith('.pdf'):
-                return self._extract_from_pdf(file_path)
-            
-            # Handle Word documents
-            elif file_path.lower().endswith(('.docx', '.doc')):
-                return self._extract_from_docx(file_path)
-            
-            # Handle text files
-            elif mime_type and mime_type.startswith('text/'):
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    return f.read()
-            
-            # Handle other common file types
-            else:
-                # For now, just return a message for unsupported file types
-                logger.warning(f"Unsupported file type for {file_path}")
-                return f"This file type is not currently supported for text extraction: {os.path.basename(file_path)}"
-        
+            return self._extract_text(file_path, stream)
         except Exception as e:
             logger.error(f"Error extracting text from {file_path}: {e}", exc_info=True)
             return f"Error processing file: {str(e)}"
 
-    def _extract_from_pdf(self, file_path: str) -> str:
-        """Extract text from a PDF file."""
-        text = ""
-        try:
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(reader.pages)):
-                    text += reader.pages[page_num].extract_text() + "\n"
-            return text
-        except Exception as e:
-            logger.error(f"Error extracting text from PDF {file_path}: {e}", exc_info=True)
-            return f"Error processing PDF: {str(e)}"
+    def _unsupported_message(self, file_path: str) -> str:
+        return f"This file type is not currently supported for text extraction: {os.path.basename(file_path)}"
+
+    def _extract_text(self, file_path: str, stream: Optional[BinaryIO] = None) -> str:
+        """Extracts text from a supported file, raising on failure."""
+        # Handle PDFs
+        if file_path.lower().endswith('.pdf'):
+            return self._extract_from_pdf(stream or file_path)
+        
+        # Handle Word documents
+        elif file_path.lower().endswith(('.docx', '.doc')):
+            return self._extract_from_docx(stream or file_path)
+        
+        # Handle text files
+        if stream is not None:
+            return stream.read().decode('utf-8', errors='replace')
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
 
-    def _extract_from_docx(self, file_path: str) -> str:
-        """Extract text from a Word document."""
+    def _extract_from_pdf(self, source: Union[str, BinaryIO]) -> str:
+        """Extract text from a PDF file (path or seekable binary stream)."""
+        if isinstance(source, str):
+            size = os.path.getsize(source)
+        else:
+            size = source.seek(0, io.SEEK_END)
+            source.seek(0)
+        if size >= PARALLEL_PDF_MIN_BYTES and PDF_WORKERS > 1:
+            try:
+                return self._extract_pdf_parallel(source)
+            except Exception as e:
+                logger.warning(f"Parallel PDF extraction failed, extracting serially: {e}")
+                if not isinstance(source, str):
+                    source.seek(0)
+        if pypdfium2 is not None:
+            try:
+                pdfium_source = source
+                if not isinstance(source, str) and not hasattr(source, 'readinto'):
+                    pdfium_source = source.read() # pypdfium2 streams need readinto (mmap has none); bytes work directly
+                with _PDFIUM_LOCK:
+                    return _pdfium_text(pdfium_source)
+            except Exception as e:
+                logger.warning(f"pypdfium2 could not read PDF {source}, falling back to PyPDF2: {e}")
+                if not isinstance(source, str):
+                    source.seek(0)
+        return _pypdf2_text(source)
+
+    def _extract_pdf_parallel(self, source: Union[str, BinaryIO]) -> str:
+        """Extracts PDF text across the shared process pool, one slice per worker, in page order."""
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                data = f.read()
+        else:
+            data = source.read()
+        pool = _get_pdf_pool()
         try:
-            doc = docx.Document(file_path)
-            return "\n".join([paragraph.text for paragraph in doc.paragraphs])
-        except Exception as e:
-            logger.error(f"Error extracting text from DOCX {file_path}: {e}", exc_info=True)
-            return f"Error processing Word document: {str(e)}"
+            futures = [pool.submit(_extract_pdf_part, data, part, PDF_WORKERS, pypdfium2 is not None)
+                       for part in range(PDF_WORKERS)]
+            return "".join(future.result() for future in futures)
+        except BrokenProcessPool:
+            _discard_pdf_pool(pool)
+            raise
+
+    def _extract_from_docx(self, source: Union[str, BinaryIO]) -> str:
+        """Extract text from a Word document (path or seekable binary stream)."""
+        doc = docx.Document(source)
+        return "\n".join([paragraph.text for paragraph in doc.paragraphs])
 
     def get_file_content(self, file_id: str) -> Tuple[str, str]:
         """Get the content of a file by its ID.
@@ -76,50 +200,52 @@ class FileProcessor:
         Returns:
             Tuple containing (filename, file_content)
         """
-        # Check if content is already cached
-        if file_id in self.file_content_cache:
-            manifest = self.metadata_manager.load_manifest(file_id)
-            return manifest.original_filename, self.file_content_cache[file_id]
-        
-        # Get file info
+        # Get file info (one stat on a manifest-cache hit); also guards cached content of deleted files
         manifest = self.metadata_manager.load_manifest(file_id)
         if not manifest:
             return "", f"File with ID {file_id} not found."
         
-        # Create temp directory for download
-        temp_dir = tempfile.mkdtemp(prefix='ass_file_processor_')
-        temp_path = os.path.join(temp_dir, manifest.original_filename)
+        # Extracted text belongs to the current version; updating or restoring the file changes it
+        current_version = manifest.get_current_version()
+        version_id = current_version.version_id if current_version else ""
+        
+        # Check if content is already cached
+        cached = self.file_content_cache.get(file_id)
+        if cached is not None and cached[0] == version_id:
+            return manifest.original_filename, cached[1]
+        
+        # Text extracted earlier (by this or another process) is stored next to the manifest
+        content = self.metadata_manager.load_extracted_text(file_id, version_id)
+        if content is not None:
+            self.file_content_cache.put(file_id, (version_id, content))
+            return manifest.original_filename, content
         
+        # Nothing to extract, so don't download it (and don't persist the message)
+        if not self.is_supported(manifest.original_filename):
+            return manifest.original_filename, self._unsupported_message(manifest.original_filename)
+        
+        # Reassemble the file in memory and parse it from there; nothing is written to disk
         try:
-            # Download the file
-            self.chunk_manager.download_file(file_id, temp_path)
-            
-            # Extract text content
-            content = self.extract_text_from_file(temp_path)
+            buffer = self.chunk_manager.download_to_buffer(file_id)
+            try:
+                # Extract text content; failures raise, so they are never cached or persisted
+                content = self._extract_text(manifest.original_filename, buffer)
+            finally:
+                buffer.close()
             
-            # Cache the content
-            self.file_content_cache[file_id] = content
+            # Cache the content, and persist it so the file is only downloaded and parsed once
+            self.file_content_cache.put(file_id, (version_id, content))
+            self.metadata_manager.save_extracted_text(file_id, version_id, content)
             
             return manifest.original_filename, content
         
         except Exception as e:
             logger.error(f"Error processing file {file_id}: {e}", exc_info=True)
             return manifest.original_filename, f"Error processing file: {str(e)}"
-        
-        finally:
-            # Clean up
-            try:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                if os.path.exists(temp_dir):
-                    os.rmdir(temp_dir)
-            except OSError as e:
-                logger.error(f"Error cleaning up temp files: {e}")
 
     def clear_cache(self, file_id: Optional[str] = None):
         """Clear the file content cache for a specific file or all files."""
         if file_id:
-            if file_id in self.file_content_cache:
-                del self.file_content_cache[file_id]
+            self.file_content_cache.pop(file_id)
         else:
             self.file_content_cache.clear()
\ No newline at end of file
@@ -10,12 +10,27 @@ import os
 import uuid
 import time
 import datetime
+import sqlite3
+import sys
+import threading
 from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional, Tuple
 
+try:
+    import orjson # Optional: several times faster manifest (de)serialization
+except ImportError:
+    orjson = None
+
+from .cache import LRUCache
+
 METADATA_DIR = "metadata" # Local directory to store manifest files
+MANIFEST_CACHE_SIZE = 1024 # Number of parsed manifests kept in memory
+INDEX_DB = "manifests.db" # SQLite index of the manifests' listing fields, kept next to them
 
-@dataclass
+# Manifests of large files hold thousands of ChunkInfo objects; slots drop their per-instance __dict__
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class ChunkInfo:
     """Information about a single chunk of a file."""
     chunk_index: int        # 0-based index
@@ -44,23 +59,26 @@ class ChunkInfo:
         )
 
 class FileVersion:
-    """Information about a specific version of a file."""
+    """Information about a specific version of a file.
+
+    Which version is current is tracked by the owning FileManifest (current_version_idx).
+    """
     
-    def __init__(self, version_id: str, timestamp: float, chunks: List[ChunkInfo], 
-                 is_current: bool = True, notes: str = ""):
+    __slots__ = ("version_id", "timestamp", "chunks", "notes")
+    
+    def __init__(self, version_id: str, timestamp: float, chunks: List[ChunkInfo], notes: str = ""):
         self.version_id = version_id
         self.timestamp = timestamp
         self.chunks = chunks
-        self.is_current = is_current
         self.notes = notes
     
-    def to_dict(self) -> Dict[str, Any]:
+    def to_dict(self, is_current: bool = False) -> Dict[str, Any]:
         return {
             "version_id": self.version_id,
             "timestamp": self.timestamp,
             "timestamp_readable": datetime.datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
             "chunks": [chunk.to_dict() for chunk in self.chunks],
-            "is_current": self.is_current,
+            "is_current": is_current,
             "notes": self.notes
         }
     
@@ -70,7 +88,6 @@ class FileVersion:
             version_id=data.get("version_id", str(uuid.uuid4())),
             timestamp=data.get("timestamp", time.time()),
             chunks=[ChunkInfo.from_dict(chunk) for chunk in data.get("chunks", [])],
-            is_current=data.get("is_current", True),
             notes=data.get("notes", "")
         )
 
@@ -84,6 +101,7 @@ class FileManifest:
     created_at: float = field(default_factory=time.time)
     updated_at: float = field(default_factory=time.time)
     versions: List[FileVersion] = field(default_factory=list)
+    current_version_idx: int = -1 # Index into versions; -1 (the default) means the latest
     # TODO: Add encryption details if needed
 
     @property
@@ -93,41 +111,38 @@ class FileManifest:
         return current_version.chunks if current_version else []
     
     def add_version(self, chunks: List[ChunkInfo], notes: str = "") -> str:
-        """Add a new version of the file."""
-        for version in self.versions:
-            version.is_current = False
-        
+        """Add a new version of the file and make it current."""
         version_id = str(uuid.uuid4())
         version = FileVersion(
             version_id=version_id,
             timestamp=time.time(),
             chunks=chunks,
-            is_current=True,
             notes=notes
         )
         self.versions.append(version)
+        self.current_version_idx = len(self.versions) - 1
         self.updated_at = version.timestamp
         return version_id
     
     def get_current_version(self) -> Optional[FileVersion]:
         """Get the current version of the file."""
-        for version in self.versions:
-            if version.is_current:
-                return version
-        return None if not self.versions else self.versions[-1]
+        if not self.versions:
+            return None
+        if -len(self.versions) <= self.current_version_idx < len(self.versions):
+            return self.versions[self.current_version_idx]
+        return self.versions[-1]
     
     def set_current_version(self, version_id: str) -> bool:
         """Set a specific version as the current version."""
-        found = False
-        for version in self.versions:
-            is_target = (version.version_id == version_id)
-            version.is_current = is_target
-            if is_target:
-                found = True
+        for idx, version in enumerate(self.versions):
+            if version.version_id == version_id:
+                self.current_version_idx = idx
                 self.updated_at = time.time()
-        return found
+                return True
+        return False
     
     def to_dict(self) -> Dict[str, Any]:
+        current = self.get_current_version()
         created_at_readable = datetime.datetime.fromtimestamp(self.created_at).strftime('%Y-%m-%d %H:%M:%S')
         updated_at_readable = datetime.datetime.fromtimestamp(self.updated_at).strftime('%Y-%m-%d %H:%M:%S')
         return {
@@ -139,7 +154,7 @@ class FileManifest:
             "created_at_readable": created_at_readable,
             "updated_at": self.updated_at,
             "updated_at_readable": updated_at_readable,
-            "versions": [version.to_dict() for version in self.versions]
+            "versions": [version.to_dict(is_current=version is current) for version in self.versions]
         }
     
     @classmethod
@@ -158,7 +173,11 @@ class FileManifest:
             chunks = [ChunkInfo.from_dict(chunk) for chunk in data.get("chunks", [])]
             manifest.add_version(chunks, "Migrated from old format")
         else:
-            manifest.versions = [FileVersion.from_dict(vd) for vd in data.get("versions", [])]
+            versions_data = data.get("versions", [])
+            manifest.versions = [FileVersion.from_dict(vd) for vd in versions_data]
+            # The file format keeps a per-version is_current flag (missing means set); the first set one wins
+            manifest.current_version_idx = next(
+                (idx for idx, vd in enumerate(versions_data) if vd.get("is_current", True)), -1)
         
         return manifest
 
@@ -168,6 +187,23 @@ class MetadataManager:
     def __init__(self, metadata_dir: str = METADATA_DIR):
         self.metadata_dir = metadata_dir
         os.makedirs(self.metadata_dir, exist_ok=True)
+        # path -> ((mtime_ns, size), manifest data); the stat key picks up edits made by other processes
+        self._manifest_cache = LRUCache(maxsize=MANIFEST_CACHE_SIZE)
+        self._index = None
+        self._index_lock = threading.Lock()
+        try:
+            # Shared by the web/bot worker threads, so access is serialized through _index_lock
+            self._index = sqlite3.connect(os.path.join(self.metadata_dir, INDEX_DB), check_same_thread=False)
+            self._index.execute("PRAGMA journal_mode=WAL")
+            self._index.execute(
+                "CREATE TABLE IF NOT EXISTS manifests ("
+                "file_id TEXT PRIMARY KEY, original_filename TEXT NOT NULL, total_size INTEGER, "
+                "updated_at REAL, mtime_ns INTEGER, size INTEGER)"
+            )
+            self._index.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open manifest index, listing will read every manifest: {e}")
+            self._index = None
         print(f"MetadataManager initialized. Manifests stored in: {os.path.abspath(self.metadata_dir)}")
 
     def generate_file_id(self) -> str:
@@ -185,9 +221,14 @@ class MetadataManager:
     def save_manifest(self, manifest: FileManifest):
         """Saves a file manifest to a JSON file."""
         path = self._get_manifest_path(manifest.file_id)
+        self._manifest_cache.pop(path)
         try:
-            with open(path, 'w') as f:
-                json.dump(manifest.to_dict(), f, indent=4)
+            data = manifest.to_dict()
+            # Binary write skips the text encoder; orjson builds the whole document in C
+            raw = orjson.dumps(data, option=orjson.OPT_INDENT_2) if orjson else json.dumps(data, indent=4).encode()
+            with open(path, 'wb') as f:
+                f.write(raw)
+            self._index_manifest(manifest, os.stat(path))
             print(f"Saved manifest for file '{manifest.original_filename}' (ID: {manifest.file_id}) to {path}")
         except IOError as e:
             print(f"Error saving manifest file {path}: {e}")
@@ -199,17 +240,28 @@ class MetadataManager:
     def load_manifest(self, file_id: str) -> Optional[FileManifest]:
         """Loads a file manifest from its JSON file."""
         path = self._get_manifest_path(file_id)
-        if not os.path.exists(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._manifest_cache.pop(path)
             return None
+        stat_key = (st.st_mtime_ns, st.st_size)
         try:
-            with open(path, 'r') as f:
-                data = json.load(f)
+            cached = self._manifest_cache.get(path)
+            if cached is not None and cached[0] == stat_key:
+                # Unchanged on disk; rebuild from the parsed data so callers get their own object
+                return FileManifest.from_dict(cached[1])
+            with open(path, 'rb') as f:
+                raw = f.read()
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so the handler below covers both
+            data = orjson.loads(raw) if orjson else json.loads(raw)
             if not isinstance(data, dict):
                 print(f"Error: Manifest file {path} contains invalid format (not a dictionary)")
                 return None
             if not all(key in data for key in ["original_filename", "total_size", "chunk_size"]):
                 print(f"Error: Manifest file {path} is missing required fields")
                 return None
+            self._manifest_cache.put(path, (stat_key, data))
             return FileManifest.from_dict(data)
         except (IOError, json.JSONDecodeError) as e:
             print(f"Error loading or parsing manifest file {path}: {e}")
@@ -218,9 +270,77 @@ class MetadataManager:
             print(f"Error reconstructing manifest from {path}: {e}")
             return None
 
+    def _index_manifest(self, manifest: FileManifest, st: os.stat_result):
+        """Records a manifest's listing fields and the file state they were read from."""
+        if self._index is None:
+            return
+        try:
+            with self._index_lock, self._index:
+                self._index.execute(
+                    "INSERT OR REPLACE INTO manifests VALUES (?, ?, ?, ?, ?, ?)",
+                    (manifest.file_id, manifest.original_filename, manifest.total_size,
+                     manifest.updated_at, st.st_mtime_ns, st.st_size),
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: Could not update manifest index for {manifest.file_id}: {e}")
+
+    def _get_text_path(self, file_id: str, version_id: str) -> str:
+        """Constructs the path to the extracted text of one version, stored next to the manifest."""
+        safe_version_id = "".join(c for c in version_id if c.isalnum() or c in ('-', '_'))
+        return os.path.splitext(self._get_manifest_path(file_id))[0] + f".{safe_version_id}.txt"
+
+    def save_extracted_text(self, file_id: str, version_id: str, text: str) -> bool:
+        """Stores the extracted text of a file version so it only has to be extracted once."""
+        path = self._get_text_path(file_id, version_id)
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            return True
+        except IOError as e:
+            print(f"Error saving extracted text to {path}: {e}")
+            return False
+
+    def load_extracted_text(self, file_id: str, version_id: str) -> Optional[str]:
+        """Returns the stored extracted text of a file version, or None if there is none."""
+        path = self._get_text_path(file_id, version_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except (IOError, UnicodeDecodeError) as e:
+            print(f"Error loading extracted text from {path}: {e}")
+            return None
+
+    def delete_extracted_text(self, file_id: str):
+        """Removes the stored extracted text of every version of a file."""
+        prefix = os.path.splitext(os.path.basename(self._get_manifest_path(file_id)))[0] + "."
+        try:
+            with os.scandir(self.metadata_dir) as entries:
+                paths = [entry.path for entry in entries
+                         if entry.name.startswith(prefix) and entry.name.endswith(".txt")]
+        except OSError as e:
+            print(f"Error listing extracted text for {file_id}: {e}")
+            return
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error deleting extracted text {path}: {e}")
+
     def delete_manifest(self, file_id: str) -> bool:
         """Deletes a manifest file."""
         path = self._get_manifest_path(file_id)
+        self._manifest_cache.pop(path)
+        self.delete_extracted_text(file_id)
+        if self._index is not None:
+            try:
+                with self._index_lock, self._index:
+                    self._index.execute("DELETE FROM manifests WHERE file_id = ?", (file_id,))
+            except sqlite3.Error as e:
+                print(f"Warning: Could not remove {file_id} from manifest index: {e}")
         if os.path.exists(path):
             try:
                 os.remove(path)
@@ -234,19 +354,55 @@ class MetadataManager:
             return False # Indicate file didn't exist
 
     def list_manifests(self) -> List[Tuple[str, str]]:
-        """Lists available manifests (file_id, original_filename)."""
+        """Lists available manifests (file_id, original_filename).
+
+        Names come from the SQLite index; only manifests that are new or changed on disk since
+        they were indexed (e.g. written by another process) are parsed.
+        """
+        indexed = {}
+        if self._index is not None:
+            try:
+                with self._index_lock:
+                    rows = self._index.execute("SELECT file_id, original_filename, mtime_ns, size FROM manifests").fetchall()
+                indexed = {file_id: (name, (mtime_ns, size)) for file_id, name, mtime_ns, size in rows}
+            except sqlite3.Error as e:
+                print(f"Warning: Could not read manifest index: {e}")
+
         manifests = []
+        seen = set()
         try:
-            for filename in os.listdir(self.metadata_dir):
-                if filename == "users.json": # Skip user data file
-                    continue
-                if filename.endswith(".json"):
-                    file_id = filename[:-5]
-                    manifest = self.load_manifest(file_id)
-                    if manifest and hasattr(manifest, 'file_id') and hasattr(manifest, 'original_filename'):
-                        manifests.append((manifest.file_id, manifest.original_filename))
-                    else:
-                         print(f"Warning: Found invalid manifest file: {filename}")
+            with os.scandir(self.metadata_dir) as entries:
+                for entry in entries:
+                    filename = entry.name
+                    if filename == "users.json": # Skip user data file
+                        continue
+                    if filename.endswith(".json"):
+                        file_id = filename[:-5]
+                        seen.add(file_id)
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        cached = indexed.get(file_id)
+                        if cached and cached[1] == (st.st_mtime_ns, st.st_size):
+                            manifests.append((file_id, cached[0]))
+                            continue
+                        manifest = self.load_manifest(file_id)
+                        if manifest and hasattr(manifest, 'file_id') and hasattr(manifest, 'original_filename'):
+                            manifests.append((manifest.file_id, manifest.original_filename))
+                            self._index_manifest(manifest, st)
+                        else:
+                             print(f"Warning: Found invalid manifest file: {filename}")
         except OSError as e:
              print(f"Error listing manifest directory {self.metadata_dir}: {e}")
-        return manifests 
\ No newline at end of file
+             return manifests
+
+        # Forget manifests that were removed from disk behind our back
+        stale = [file_id for file_id in indexed if file_id not in seen]
+        if stale and self._index is not None:
+            try:
+                with self._index_lock, self._index:
+                    self._index.executemany("DELETE FROM manifests WHERE file_id = ?", [(file_id,) for file_id in stale])
+            except sqlite3.Error as e:
+                print(f"Warning: Could not prune manifest index: {e}")
+        return manifests
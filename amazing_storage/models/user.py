@@ -5,6 +5,15 @@ import os
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+try:
+    import orjson # Optional: several times faster user (de)serialization
+except ImportError:
+    orjson = None
+
+def _dumps(data: Any) -> bytes:
+    """Compact JSON encoding, through orjson when available."""
+    return orjson.dumps(data) if orjson else json.dumps(data, separators=(',', ':')).encode()
+
 # Directory to store user data
 USERS_DIR = "metadata/users"
 
@@ -12,12 +21,23 @@ class User:
     def __init__(self, 
                  username: str, 
                  email: str,
-                 user_id: str = None):
+                 user_id: str = None,
+                 created_at: int = None):
         
         self.user_id = user_id or str(uuid.uuid4())
         self.username = username
         self.email = email
-        self.created_at = int(time.time())
+        self.created_at = created_at if created_at is not None else int(time.time())
+    
+    @property
+    def username(self) -> str:
+        return self._username
+    
+    @username.setter
+    def username(self, value: str):
+        # The lowercased form is what lookups compare, so compute it once per change
+        self._username = value
+        self.username_lower = value.lower() if value is not None else ""
         
     def to_dict(self) -> Dict[str, Any]:
         """Convert user object to dictionary for storage"""
@@ -35,20 +55,23 @@ class User:
             user_id=data.get("user_id"),
             username=data.get("username"),
             email=data.get("email"),
+            created_at=data.get("created_at"),
         )
         
     def save(self):
         """Save user to storage"""
         os.makedirs(USERS_DIR, exist_ok=True)
         path = os.path.join(USERS_DIR, f"{self.user_id}.json")
-        with open(path, 'w') as f:
-            json.dump(self.to_dict(), f, indent=4)
+        with open(path, 'wb') as f:
+            f.write(_dumps(self.to_dict()))
 
 
 class UserManager:
     def __init__(self, data_dir="metadata"):
         self.users_file = os.path.join(data_dir, "users.json")
         self.users = {}
+        self._username_index = {}  # lowercased username -> user_id (the first user with that name)
+        self._indexed_names = {}  # user_id -> lowercased username as of the last load/save
         self._ensure_data_dir(data_dir)
         self._load_users()
         
@@ -62,12 +85,15 @@ class UserManager:
             return
             
         try:
-            with open(self.users_file, 'r') as f:
-                user_dicts = json.load(f)
+            with open(self.users_file, 'rb') as f:
+                raw = f.read()
+            user_dicts = orjson.loads(raw) if orjson else json.loads(raw)
                 
             for user_dict in user_dicts:
                 user = User.from_dict(user_dict)
                 self.users[user.user_id] = user
+                self._indexed_names[user.user_id] = user.username_lower
+                self._username_index.setdefault(user.username_lower, user.user_id)
         except Exception as e:
             print(f"Error loading users: {e}")
             
@@ -75,8 +101,8 @@ class UserManager:
         """Save users to file"""
         try:
             user_dicts = [user.to_dict() for user in self.users.values()]
-            with open(self.users_file, 'w') as f:
-                json.dump(user_dicts, f, indent=2)
+            with open(self.users_file, 'wb') as f:
+                f.write(_dumps(user_dicts))
         except Exception as e:
             print(f"Error saving users: {e}")
             
@@ -90,20 +116,35 @@ class UserManager:
         
     def get_user_by_username(self, username):
         """Get user by username (still might be useful for lookup)"""
-        for user in self.users.values():
-            if user.username.lower() == username.lower():
-                return user
-        return None
+        return self.users.get(self._username_index.get(username.lower()))
+        
+    def _unindex_username(self, username_lower, user_id):
+        """Drops a user's username index entry, handing the name to another user that shares it."""
+        if self._username_index.get(username_lower) != user_id:
+            return
+        del self._username_index[username_lower]
+        for other_id, other_name in self._indexed_names.items():
+            if other_id != user_id and other_name == username_lower:
+                self._username_index[username_lower] = other_id
+                break
         
     def save_user(self, user):
         """Save or update a user"""
         self.users[user.user_id] = user
+        # Compare with the name recorded at the last save: the object may have been renamed in place
+        username_lower = user.username_lower
+        previous = self._indexed_names.get(user.user_id)
+        self._indexed_names[user.user_id] = username_lower
+        if previous is not None and previous != username_lower:
+            self._unindex_username(previous, user.user_id)
+        self._username_index.setdefault(username_lower, user.user_id)
         self._save_users()
         
     def delete_user(self, user_id):
         """Delete a user"""
         if user_id in self.users:
             del self.users[user_id]
+            self._unindex_username(self._indexed_names.pop(user_id), user_id)
             self._save_users()
             return True
         return False
\ No newline at end of file
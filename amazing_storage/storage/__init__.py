@@ -43,7 +43,8 @@ def get_storage_provider(bucket_config: BucketConfig) -> StorageProvider:
         try:
             # Pass additional args needed for specific providers (like Dropbox OAuth)
             if provider_class is DropboxStorage:
-                from ..config import app_config # Import here to avoid circular dependency at top level
+                from ..config import get_config # Import here to avoid circular dependency at top level
+                app_config = get_config()
                 if not app_config.dropbox_app_key or not app_config.dropbox_app_secret:
                      raise ValueError("Dropbox App Key/Secret not configured in environment (ASS_DROPBOX_APP_KEY, ASS_DROPBOX_APP_SECRET)")
                 # Find the index of this bucket in the original config list
@@ -1,5 +1,10 @@
+import os
+import threading
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, IO, Tuple
+from typing import List, Dict, Any, IO, Tuple, Optional, Union
+
+# Serializes seek+write pairs on platforms without os.pwrite (the file position is shared)
+_SEEK_WRITE_LOCK = threading.Lock()
 
 class StorageProviderError(Exception):
     """Exception raised for errors in the storage providers.
@@ -16,6 +21,34 @@ class StorageProviderError(Exception):
         self.original_error = original_error
         super().__init__(f"{provider_type} provider error: {message}")
 
+class ChunkSink:
+    """File-like writer that hashes data and writes it into a file descriptor at a fixed offset.
+
+    Several sinks can write into the same descriptor concurrently, each into its own region.
+    """
+
+    def __init__(self, fd: int, offset: int, hasher: Optional[Any] = None):
+        self.fd = fd
+        self.offset = offset
+        self.hasher = hasher
+        self.written = 0
+
+    def write(self, data) -> int:
+        if self.hasher is not None:
+            self.hasher.update(data)
+        view = memoryview(data)
+        while view:
+            position = self.offset + self.written
+            if hasattr(os, "pwrite"):
+                n = os.pwrite(self.fd, view, position)
+            else:
+                with _SEEK_WRITE_LOCK:
+                    os.lseek(self.fd, position, os.SEEK_SET)
+                    n = os.write(self.fd, view)
+            self.written += n
+            view = view[n:]
+        return len(data)
+
 class StorageProvider(ABC):
     """Abstract base class for all storage providers."""
 
@@ -26,12 +59,13 @@ class StorageProvider(ABC):
         self.provider_type = "unknown"  # To be set by implementing classes
 
     @abstractmethod
-    def upload_chunk(self, chunk_data: bytes, chunk_name: str) -> str:
+    def upload_chunk(self, chunk_data: Union[bytes, memoryview], chunk_name: str) -> str:
         """
         Uploads a chunk of data to the storage.
 
         Args:
-            chunk_data: The byte content of the chunk.
+            chunk_data: The byte content of the chunk; a memoryview when it is read
+                straight from a mapped file, so providers convert only if their SDK needs bytes.
             chunk_name: A unique name for the chunk (e.g., filename_part_001).
 
         Returns:
@@ -59,6 +93,30 @@ class StorageProvider(ABC):
         """
         pass
 
+    def download_chunk_into(self, chunk_id: str, fd: int, offset: int, hasher: Optional[Any] = None) -> int:
+        """
+        Downloads a chunk straight into an open file descriptor at the given offset.
+
+        Providers that can stream should override this so the chunk is never held in
+        memory whole; the default buffers it through download_chunk.
+
+        Args:
+            chunk_id: The unique identifier returned by upload_chunk.
+            fd: A file descriptor opened for writing.
+            offset: Position in the file where the chunk starts.
+            hasher: Optional hashlib-style object updated with the chunk bytes as they arrive.
+
+        Returns:
+            The number of bytes written.
+
+        Raises:
+            StorageProviderError: If there is an error downloading the chunk.
+            FileNotFoundError: If the chunk_id does not exist.
+        """
+        sink = ChunkSink(fd, offset, hasher)
+        sink.write(self.download_chunk(chunk_id))
+        return sink.written
+
     @abstractmethod
     def list_files(self, folder_path: str = "") -> List[Dict[str, Any]]:
         """
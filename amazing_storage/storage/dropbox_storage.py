@@ -7,9 +7,10 @@ from dropbox.exceptions import ApiError, AuthError
 from dropbox.files import WriteMode, FileMetadata, FolderMetadata, DeletedMetadata
 from typing import List, Dict, Any, Tuple, Optional
 import os
-from .base import StorageProvider
+from .base import StorageProvider, ChunkSink
 
 TOKEN_DIR = "." # Store tokens in project root for simplicity; use a more secure location in production.
+DOWNLOAD_BLOCK_SIZE = 64 * 1024 # Bytes read from the response at a time when streaming a chunk
 
 class DropboxStorage(StorageProvider):
     """Storage provider implementation for Dropbox using OAuth 2 with refresh tokens."""
@@ -169,7 +170,7 @@ class DropboxStorage(StorageProvider):
             dbx = self._get_refreshed_client()
             self._ensure_folder_exists(self.folder_path)
             metadata = dbx.files_upload(
-                chunk_data,
+                bytes(chunk_data), # The SDK only takes bytes; a no-op for bytes input
                 full_path,
                 mode=WriteMode('overwrite')
             )
@@ -197,6 +198,26 @@ class DropboxStorage(StorageProvider):
              print(f"AuthError downloading chunk for provider {self.provider_index}: {auth_error}. Needs authorization.")
              raise
 
+    def download_chunk_into(self, chunk_id: str, fd: int, offset: int, hasher=None) -> int:
+        """Streams a chunk from Dropbox into the file at the given offset."""
+        try:
+            dbx = self._get_refreshed_client()
+            metadata, res = dbx.files_download(path=chunk_id)
+            sink = ChunkSink(fd, offset, hasher)
+            with res:
+                for block in res.iter_content(chunk_size=DOWNLOAD_BLOCK_SIZE):
+                    sink.write(block)
+            return sink.written
+        except ApiError as error:
+            if isinstance(error.error, dropbox.files.DownloadError) and error.error.is_path() and error.error.get_path().is_not_found():
+                raise FileNotFoundError(f"Chunk with path '{chunk_id}' not found in Dropbox for provider {self.provider_index}.")
+            else:
+                print(f"An error occurred downloading chunk '{chunk_id}' from Dropbox for provider {self.provider_index}: {error}")
+                raise
+        except AuthError as auth_error:
+             print(f"AuthError downloading chunk for provider {self.provider_index}: {auth_error}. Needs authorization.")
+             raise
+
     def list_files(self, folder_path: str = "") -> List[Dict[str, Any]]:
         """Lists files using a refreshed client."""
         list_path = self.folder_path if not folder_path else self._get_full_path(folder_path)
@@ -1,5 +1,6 @@
 import io
 import os.path
+import threading
 from typing import List, Dict, Any, Tuple, Optional
 import tempfile
 
@@ -11,7 +12,7 @@ from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload, MediaFi
 from google.oauth2 import service_account
 from google.auth.exceptions import GoogleAuthError
 
-from .base import StorageProvider, StorageProviderError
+from .base import StorageProvider, StorageProviderError, ChunkSink
 from ..config import BucketConfig 
 
 
@@ -31,9 +32,14 @@ class GoogleDriveStorage(StorageProvider):
         if not self.folder_id:
             raise ValueError("Google Drive 'folder_id' is required in config.")
         
+        # googleapiclient services sit on a single httplib2.Http, which is not thread-safe, and
+        # ChunkManager uploads/downloads chunks from a thread pool: each thread gets its own service
+        self._credentials = None
+        self._local = threading.local()
+        
         # Authenticate and get drive service
         try:
-            self.drive_service = self._authenticate()
+            self._local.service = self._authenticate()
             self._ensure_folder_exists(self.folder_id)
             print(f"Successfully authenticated Google Drive for: {self.credentials_file}")
             print(f"Confirmed Google Drive folder exists: {self.folder_id}")
@@ -53,6 +59,7 @@ class GoogleDriveStorage(StorageProvider):
             
             # Build the drive service
             drive_service = build("drive", "v3", credentials=credentials)
+            self._credentials = credentials
             return drive_service
         except (GoogleAuthError, FileNotFoundError, ValueError) as e:
             raise StorageProviderError(
@@ -67,6 +74,15 @@ class GoogleDriveStorage(StorageProvider):
                 original_error=e
             )
 
+    @property
+    def drive_service(self) -> Resource:
+        """The Drive service for the calling thread, built on first use from the shared credentials."""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = build("drive", "v3", credentials=self._credentials)
+            self._local.service = service
+        return service
+
     def _ensure_folder_exists(self, folder_id: str):
          """Checks if the configured folder ID exists."""
          try:
@@ -160,6 +176,35 @@ class GoogleDriveStorage(StorageProvider):
                 original_error=e
             )
 
+    def download_chunk_into(self, chunk_id: str, fd: int, offset: int, hasher=None) -> int:
+        """Streams a chunk from Google Drive into the file at the given offset."""
+        try:
+            request = self.drive_service.files().get_media(fileId=chunk_id)
+            sink = ChunkSink(fd, offset, hasher)
+            downloader = MediaIoBaseDownload(sink, request)
+            
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+            return sink.written
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise FileNotFoundError(f"Chunk with ID {chunk_id} not found")
+            else:
+                raise StorageProviderError(
+                    self.provider_type,
+                    f"Failed to download chunk {chunk_id}: {str(e)}",
+                    original_error=e
+                )
+        except OSError:
+            raise # Local write failure, not a provider error
+        except Exception as e:
+            raise StorageProviderError(
+                self.provider_type,
+                f"Unexpected error downloading chunk {chunk_id}: {str(e)}",
+                original_error=e
+            )
+
     def list_files(self, folder_path: str = "") -> List[Dict[str, Any]]:
         """Lists files/folders within the configured parent folder."""
         try:
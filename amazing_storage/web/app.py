@@ -6,7 +6,7 @@ import json
 import tempfile
 import shutil
 import asyncio
-from flask import Flask, request, jsonify, send_from_directory, render_template, abort, flash, redirect, session, url_for, send_file
+from flask import Flask, request, jsonify, send_from_directory, render_template, abort, flash, redirect, session, url_for, send_file, Response, stream_with_context
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -14,7 +14,8 @@ from functools import wraps
 from ..core.metadata import MetadataManager
 from ..core.chunk_manager import ChunkManager
 from ..core.file_processor import FileProcessor
-from ..config import app_config
+from ..core.cache import single_instance
+from ..config import get_config
 from ..chatbot.chatbot import ChatbotClient
 
 # Add Dropbox imports
@@ -25,36 +26,42 @@ from dropbox.oauth import OAuth2FlowResult
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', secrets.token_hex(16))
 
-# Configure upload folder
-UPLOAD_FOLDER = tempfile.mkdtemp(prefix='ass_uploads_')
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-print(f"Flask app configured. Using temporary upload folder: {UPLOAD_FOLDER}")
-
-# Initialize managers
-metadata_manager = MetadataManager(metadata_dir="metadata")
-chunk_manager = ChunkManager(metadata_manager)
-chatbot_client = ChatbotClient()
-file_processor = FileProcessor(metadata_manager, chunk_manager)
-
-# Set file processor for chatbot
-chatbot_client.set_file_processor(file_processor)
-
-# Track active file contexts per user session
-user_active_files = {}
+# Core components and the upload folder are created on first use, not at import time:
+# the PDF worker processes re-import the main module, and must not connect to storage
+@single_instance
+def get_upload_folder() -> str:
+    upload_folder = tempfile.mkdtemp(prefix='ass_uploads_')
+    print(f"Flask app configured. Using temporary upload folder: {upload_folder}")
+    return upload_folder
+
+@single_instance
+def get_metadata_manager() -> MetadataManager:
+    return MetadataManager(metadata_dir="metadata")
+
+@single_instance
+def get_chunk_manager() -> ChunkManager:
+    return ChunkManager(get_metadata_manager())
+
+@single_instance
+def get_file_processor() -> FileProcessor:
+    return FileProcessor(get_metadata_manager(), get_chunk_manager())
+
+@single_instance
+def get_chatbot_client() -> ChatbotClient:
+    client = ChatbotClient()
+    # Set file processor for chatbot
+    client.set_file_processor(get_file_processor())
+    return client
 
 @app.before_request
 def initialize_session():
     """Initialize session variables if they don't exist."""
     if 'user_id' not in session:
         session['user_id'] = secrets.token_hex(16)
-    
-    # Initialize user's active files tracking
-    user_id = session['user_id']
-    if user_id not in user_active_files:
-        user_active_files[user_id] = set()
 
 def get_dropbox_oauth_flow():
     """Get a DropboxOAuth2Flow configured from the app settings."""
+    app_config = get_config()
     # Check for required credentials
     if not app_config.dropbox_app_key:
         raise ValueError("Dropbox App Key not configured (ASS_DROPBOX_APP_KEY)")
@@ -75,6 +82,7 @@ def get_dropbox_oauth_flow():
 @app.route('/dropbox_auth/<int:provider_index>')
 def dropbox_auth_start(provider_index):
     """Starts the Dropbox OAuth 2 authorization flow."""
+    app_config = get_config()
     if not app_config.dropbox_app_key or not app_config.dropbox_app_secret or not app_config.dropbox_redirect_uri:
         return "Error: Dropbox OAuth settings (App Key, Secret, Redirect URI) are not configured in environment variables.", 500
 
@@ -105,10 +113,10 @@ def dropbox_auth_callback():
 
         # Find the corresponding DropboxStorage instance
         from ..storage.dropbox_storage import DropboxStorage 
-        if provider_index >= len(chunk_manager.providers) or not isinstance(chunk_manager.providers[provider_index], DropboxStorage):
+        if provider_index >= len(get_chunk_manager().providers) or not isinstance(get_chunk_manager().providers[provider_index], DropboxStorage):
              return f"Error: Invalid provider index {provider_index} after callback.", 500
 
-        dropbox_provider = chunk_manager.providers[provider_index]
+        dropbox_provider = get_chunk_manager().providers[provider_index]
         
         # Save the obtained tokens (including the refresh token)
         dropbox_provider._save_token_data(token_result=oauth_result)
@@ -127,13 +135,13 @@ def index():
     """Displays the main page with the file list and upload form."""
     try:
         # Get basic file list
-        file_ids_names = chunk_manager.list_files()
+        file_ids_names = get_chunk_manager().list_files()
         
         # Enhance with chunk counts
         files_with_details = []
         for file_id, filename in file_ids_names:
             # Load manifest to get chunk information
-            manifest = metadata_manager.load_manifest(file_id)
+            manifest = get_metadata_manager().load_manifest(file_id)
             chunk_count = 0
             if manifest is not None and hasattr(manifest, 'chunks'):
                 chunk_count = len(manifest.chunks)
@@ -144,9 +152,9 @@ def index():
         # Sort by filename
         files_with_details.sort(key=lambda item: item[1].lower())
         
-        total_providers = len(chunk_manager.providers)
+        total_providers = len(get_chunk_manager().providers)
         total_files = len(files_with_details)
-        chunk_size_mb = app_config.chunk_size / (1024 * 1024)
+        chunk_size_mb = get_config().chunk_size / (1024 * 1024)
         
     except Exception as e:
         app.logger.error(f"Error listing files: {e}")
@@ -208,7 +216,7 @@ def upload_file_route():
         from werkzeug.utils import secure_filename
         filename = file.filename
         secure_name = secure_filename(filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_name)
+        temp_path = os.path.join(get_upload_folder(), secure_name)
         file_id = None
         
         try:
@@ -221,7 +229,7 @@ def upload_file_route():
             time.sleep(0.1)  
             
             # Upload using ChunkManager - the chunk manager will handle its own temp files
-            file_id = chunk_manager.upload_file(temp_path, original_filename=filename)
+            file_id = get_chunk_manager().upload_file(temp_path, original_filename=filename)
             
             # Success - remove our temp file
             if os.path.exists(temp_path):
@@ -230,22 +238,23 @@ def upload_file_route():
 
             # Add file to user's active files for AI context
             user_id = session.get('user_id')
+            added_to_context = False
             if user_id and file_id:
-                if user_id not in user_active_files:
-                    user_active_files[user_id] = set()
-                user_active_files[user_id].add(file_id)
-                
-                # Add file to chatbot context
-                success, message = chatbot_client.add_file_to_context(user_id, file_id)
-                context_status = "File added to AI context. You can now ask questions about it!" if success else f"Note: {message}"
-                app.logger.info(f"Added file {file_id} to AI context for user {user_id}: {success}")
+                if get_file_processor().is_supported(filename):
+                    # Add file to chatbot context; its text is extracted in the background
+                    get_chatbot_client().prefetch_file_to_context(user_id, file_id)
+                    added_to_context = True
+                    context_status = "The file is being processed for AI context; questions about it will wait until it is ready."
+                    app.logger.info(f"Processing file {file_id} for AI context of user {user_id}")
+                else:
+                    context_status = f"Note: text cannot be extracted from {filename}, so it was not added to AI context."
             else:
                 context_status = ""
 
             # Return success response
             if file_id:
                 flash(f"File '{filename}' uploaded successfully (ID: {file_id}). {context_status}", "success")
-                return jsonify({"message": f"File '{filename}' uploaded successfully", "file_id": file_id, "added_to_context": bool(user_id)}), 201
+                return jsonify({"message": f"File '{filename}' uploaded successfully", "file_id": file_id, "added_to_context": added_to_context, "context_status": context_status}), 201
             else:
                 raise ValueError("Upload process didn't return a valid file ID")
                 
@@ -265,7 +274,7 @@ def upload_file_route():
             # Clean up any partial uploads if we have a file_id
             if file_id:
                 try:
-                    chunk_manager.delete_file(file_id)
+                    get_chunk_manager().delete_file(file_id)
                     app.logger.info(f"Partial upload deleted for file_id: {file_id}")
                 except Exception as cleanup_err:
                     app.logger.error(f"Error cleaning up partial upload for {file_id}: {cleanup_err}")
@@ -278,7 +287,7 @@ def upload_file_route():
 @app.route('/download/<file_id>', methods=['GET'])
 def download_file_route(file_id):
     """Handles file downloads."""
-    manifest = metadata_manager.load_manifest(file_id)
+    manifest = get_metadata_manager().load_manifest(file_id)
     if not manifest:
         abort(404, description="File not found")
     
@@ -296,7 +305,7 @@ def download_file_route(file_id):
     
     try:
         print(f"Downloading file {file_id} to temporary path: {download_path}")
-        chunk_manager.download_file(file_id, download_path)
+        get_chunk_manager().download_file(file_id, download_path)
         
         print(f"Sending file: {download_path}")
         # Use send_from_directory for safer file sending
@@ -330,17 +339,12 @@ def delete_file_route(file_id):
         # Remove from user's active files and chatbot context if present
         user_id = session.get('user_id')
         if user_id:
-            # Remove from user's active files tracking
-            if user_id in user_active_files and file_id in user_active_files[user_id]:
-                user_active_files[user_id].remove(file_id)
-                app.logger.info(f"Removed file {file_id} from active files for user {user_id}")
-            
             # Remove from chatbot context
-            chatbot_client.remove_file_from_context(user_id, file_id)
-            app.logger.info(f"Removed file {file_id} from chatbot context for user {user_id}")
+            if get_chatbot_client().remove_file_from_context(user_id, file_id):
+                app.logger.info(f"Removed file {file_id} from chatbot context for user {user_id}")
         
         # Delete the file from storage
-        success = chunk_manager.delete_file(file_id)
+        success = get_chunk_manager().delete_file(file_id)
         if success:
             flash(f"File (ID: {file_id}) deleted successfully.", "success")
             return jsonify({"message": f"File deleted successfully", "file_id": file_id}), 200
@@ -361,7 +365,7 @@ def chat():
         if not message:
             return jsonify({"response": "Please send a message to chat."}), 400
             
-        if not chatbot_client.is_enabled():
+        if not get_chatbot_client().is_enabled():
             return jsonify({"response": "Sorry, the chatbot is not available at the moment."}), 200
         
         # Get user ID from session
@@ -375,19 +379,19 @@ def chat():
         full_prompt = f"{system_context}\n\nUser question: {message}"
         
         # Get response from the chatbot - now using the synchronous call with user context
-        response = chatbot_client.get_response(full_prompt, user_id=user_id)
+        response = get_chatbot_client().get_response_sync(full_prompt, user_id=user_id)
         
         return jsonify({"response": response}), 200
     
     except Exception as e:
         app.logger.error(f"Error in chat endpoint: {e}", exc_info=True) # Log with traceback
-        # Return the error message raised from get_response or other exceptions
+        # Return the error message raised from get_response_sync or other exceptions
         return jsonify({"response": str(e)}), 500
 
 @app.route('/versions/<file_id>', methods=['GET'])
 def view_versions(file_id):
     """Display version history for a file."""
-    manifest = metadata_manager.load_manifest(file_id)
+    manifest = get_metadata_manager().load_manifest(file_id)
     if not manifest:
         abort(404, description="File not found")
     
@@ -400,13 +404,14 @@ def view_versions(file_id):
     versions = sorted(manifest.versions, key=lambda v: v.timestamp, reverse=True)
     
     # Format timestamps for display
+    current_version = manifest.get_current_version()
     formatted_versions = []
     for version in versions:
         timestamp = datetime.fromtimestamp(version.timestamp)
         formatted_versions.append({
             'version_id': version.version_id,
             'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'is_current': version.is_current,
+            'is_current': version is current_version,
             'notes': version.notes,
             'chunk_count': len(version.chunks),
         })
@@ -421,7 +426,7 @@ def view_versions(file_id):
 @app.route('/restore/<file_id>/<version_id>', methods=['POST'])
 def restore_version(file_id, version_id):
     """Restore a previous version of a file."""
-    manifest = metadata_manager.load_manifest(file_id)
+    manifest = get_metadata_manager().load_manifest(file_id)
     if not manifest:
         abort(404, description="File not found")
     
@@ -433,7 +438,8 @@ def restore_version(file_id, version_id):
     # Set the specified version as current
     if manifest.set_current_version(version_id):
         # Save the updated manifest
-        metadata_manager.save_manifest(manifest)
+        get_metadata_manager().save_manifest(manifest)
+        get_chatbot_client().refresh_file_content(file_id)
         flash(f"Version restored successfully for '{manifest.original_filename}'", "success")
     else:
         flash(f"Failed to restore version. Version ID not found.", "danger")
@@ -443,7 +449,7 @@ def restore_version(file_id, version_id):
 @app.route('/update/<file_id>', methods=['GET', 'POST'])
 def update_file(file_id):
     """Handles uploading a new version of a file."""
-    manifest = metadata_manager.load_manifest(file_id)
+    manifest = get_metadata_manager().load_manifest(file_id)
     if not manifest:
         abort(404, description="File not found")
     
@@ -468,19 +474,20 @@ def update_file(file_id):
             # Save temporarily locally before chunking
             from werkzeug.utils import secure_filename
             filename = file.filename
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+            temp_path = os.path.join(get_upload_folder(), secure_filename(filename))
             
             try:
                 file.save(temp_path)
                 app.logger.info(f"File temporarily saved to: {temp_path}")
                 
                 # Upload new version
-                chunk_manager.upload_file(
+                get_chunk_manager().upload_file(
                     temp_path, 
                     original_filename=manifest.original_filename,
                     file_id=file_id,
                     version_notes=version_notes
                 )
+                get_chatbot_client().refresh_file_content(file_id)
                 
                 # Clean up temporary file
                 os.remove(temp_path)
@@ -516,22 +523,16 @@ def add_file_to_context(file_id):
         return jsonify({"error": "User session not found"}), 400
         
     # Check if file exists
-    manifest = metadata_manager.load_manifest(file_id)
+    manifest = get_metadata_manager().load_manifest(file_id)
     if not manifest:
         return jsonify({"error": "File not found"}), 404
     
-    # Add to user's active files tracking
-    if user_id not in user_active_files:
-        user_active_files[user_id] = set()
-    user_active_files[user_id].add(file_id)
+    if not get_file_processor().is_supported(manifest.original_filename):
+        return jsonify({"error": f"Text cannot be extracted from '{manifest.original_filename}' (unsupported file type)"}), 415
     
-    # Add to chatbot context
-    success, message = chatbot_client.add_file_to_context(user_id, file_id)
-    
-    if success:
-        return jsonify({"message": f"File '{manifest.original_filename}' added to chat context", "file_id": file_id}), 200
-    else:
-        return jsonify({"error": message}), 500
+    # Add to chatbot context (the text is extracted in the background)
+    get_chatbot_client().prefetch_file_to_context(user_id, file_id)
+    return jsonify({"message": f"File '{manifest.original_filename}' is being processed for chat context", "file_id": file_id}), 202
 
 @app.route('/file_context/remove/<file_id>', methods=['POST'])
 def remove_file_from_context(file_id):
@@ -540,12 +541,8 @@ def remove_file_from_context(file_id):
     if not user_id:
         return jsonify({"error": "User session not found"}), 400
     
-    # Remove from user's active files tracking
-    if user_id in user_active_files and file_id in user_active_files[user_id]:
-        user_active_files[user_id].remove(file_id)
-    
     # Remove from chatbot context
-    success = chatbot_client.remove_file_from_context(user_id, file_id)
+    success = get_chatbot_client().remove_file_from_context(user_id, file_id)
     
     return jsonify({"message": "File removed from chat context", "file_id": file_id}), 200
 
@@ -557,11 +554,11 @@ def list_context_files():
         return jsonify({"error": "User session not found"}), 400
     
     # Get active files for this user
-    active_file_ids = user_active_files.get(user_id, set())
+    active_file_ids = get_chatbot_client().list_files(user_id)
     active_files = []
     
     for file_id in active_file_ids:
-        manifest = metadata_manager.load_manifest(file_id)
+        manifest = get_metadata_manager().load_manifest(file_id)
         if manifest:
             active_files.append({
                 'id': file_id,
@@ -577,7 +574,7 @@ def api_list_files():
     """API endpoint to list stored files."""
     try:
         # Use the existing chunk_manager method which gets data from metadata
-        stored_files_tuples = chunk_manager.list_files()
+        stored_files_tuples = get_chunk_manager().list_files()
         # Sort by filename 
         stored_files_tuples.sort(key=lambda item: item[1].lower())
         
@@ -606,14 +603,14 @@ def api_upload_file():
         # Use original filename for metadata, secure name for temp storage
         original_filename = file.filename 
         safe_temp_filename = secure_filename(original_filename) 
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_temp_filename)
+        temp_path = os.path.join(get_upload_folder(), safe_temp_filename)
 
         try:
             file.save(temp_path)
             app.logger.info(f"API Upload: File temporarily saved to: {temp_path}")
 
             # Upload using ChunkManager, providing the original filename
-            file_id = chunk_manager.upload_file(temp_path, original_filename=original_filename)
+            file_id = get_chunk_manager().upload_file(temp_path, original_filename=original_filename)
 
             # Clean up temporary file immediately 
             os.remove(temp_path)
@@ -642,7 +639,7 @@ def api_upload_file():
 @app.route('/api/download/<file_id>', methods=['GET'])
 def api_download_file(file_id):
     """API endpoint to handle file downloads."""
-    manifest = metadata_manager.load_manifest(file_id)
+    manifest = get_metadata_manager().load_manifest(file_id)
     if not manifest:
         # Use 404 directly for API not found errors
         return jsonify({"error": "File not found"}), 404 
@@ -661,7 +658,7 @@ def api_download_file(file_id):
     try:
         app.logger.info(f"API Download: Downloading file {file_id} to temporary path: {download_path}")
         # Use the chunk manager to reassemble the file
-        chunk_manager.download_file(file_id, download_path)
+        get_chunk_manager().download_file(file_id, download_path)
         app.logger.info(f"API Download: File reassembled at {download_path}")
 
         # Use send_from_directory for safer file sending
@@ -698,7 +695,7 @@ def api_delete_file(file_id):
     try:
         # Attempt to delete the file using the chunk manager
         # This handles deleting chunks from providers and the manifest
-        success = chunk_manager.delete_file(file_id)
+        success = get_chunk_manager().delete_file(file_id)
         
         if success:
             # Even if warnings occurred during chunk deletion, the manifest is likely gone.
@@ -726,7 +723,7 @@ def api_chat():
         if not message:
             return jsonify({"error": "No message provided"}), 400
 
-        if not chatbot_client.is_enabled():
+        if not get_chatbot_client().is_enabled():
             return jsonify({"response": "Chatbot is not available"}), 200 # Not an error, just disabled
 
         # Create system context (optional, but good practice)
@@ -736,12 +733,12 @@ def api_chat():
         full_prompt = f"{system_context}\n\nUser: {message}"
 
         # Get response from the synchronous chatbot client method
-        response_text = chatbot_client.get_response(full_prompt)
+        response_text = get_chatbot_client().get_response_sync(full_prompt)
 
         return jsonify({"response": response_text}), 200
 
     except RuntimeError as e:
-        # Catch the specific error raised by get_response on failure
+        # Catch the specific error raised by get_response_sync on failure
         app.logger.error(f"Error in /api/chat endpoint (RuntimeError): {e}", exc_info=True)
         return jsonify({"error": "Chatbot interaction failed", "details": str(e)}), 500
     except Exception as e:
@@ -749,7 +746,34 @@ def api_chat():
         app.logger.error(f"Error in /api/chat endpoint: {e}", exc_info=True)
         return jsonify({"error": "An internal server error occurred", "details": str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """Streams the chatbot's answer as plain text while it is being generated."""
+    message = request.json.get('message', '')
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+
+    if not get_chatbot_client().is_enabled():
+        return jsonify({"response": "Chatbot is not available"}), 200 # Not an error, just disabled
+
+    user_id = session.get('user_id')
+
+    def generate():
+        try:
+            yield from get_chatbot_client().stream_response(message, user_id=user_id)
+        except RuntimeError as e:
+            # Headers are already sent, so the error has to go into the body
+            app.logger.error(f"Error in /api/chat/stream endpoint: {e}", exc_info=True)
+            yield f"\n{e}"
+
+    # X-Accel-Buffering stops nginx from holding the pieces back until the answer is complete
+    return Response(stream_with_context(generate()), mimetype='text/plain',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
 def run_app():
+    app_config = get_config()
+    # Connect to storage before serving, instead of during the first request
+    get_chatbot_client()
     print(f"Flask development server starting on http://{app_config.web_interface_host}:{app_config.web_interface_port}")
     app.run(host=app_config.web_interface_host, port=app_config.web_interface_port, debug=True)
 
@@ -0,0 +1,34 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from amazing_storage.bot import bot
+
+
+def _update(text):
+    return SimpleNamespace(message=SimpleNamespace(text=text), effective_user=SimpleNamespace(id=1))
+
+
+def test_quick_messages_get_one_combined_answer():
+    answered = []
+
+    async def answer_prompt(update, context, prompt, on_reply=None):
+        await asyncio.sleep(0.01)  # the model is still generating when the follow-up arrives
+        on_reply()
+        answered.append(prompt)
+
+    async def scenario():
+        context = SimpleNamespace(application=SimpleNamespace(
+            create_task=lambda coroutine, update=None: asyncio.ensure_future(coroutine)))
+        await bot.handle_text_message(_update("What does the report"), context)
+        await asyncio.sleep(0)  # let the first answer start
+        await bot.handle_text_message(_update("say about costs?"), context)
+        await asyncio.sleep(0.2)
+
+    with mock.patch.object(bot, "_answer_prompt", answer_prompt), \
+         mock.patch.object(bot, "get_chatbot_client", return_value=SimpleNamespace(is_enabled=lambda: True)), \
+         mock.patch.object(bot, "get_config", return_value=SimpleNamespace(chatbot_debounce_seconds=0.05)):
+        asyncio.run(scenario())
+
+    assert answered == ["What does the report\nsay about costs?"]
+    assert not bot._pending_prompts and not bot._flush_tasks
@@ -0,0 +1,36 @@
+import io
+
+from amazing_storage.core.file_processor import FileProcessor
+from amazing_storage.core.metadata import ChunkInfo, FileManifest, MetadataManager
+
+
+class FakeChunkManager:
+    """Serves each version's content by the chunk ID of its only chunk."""
+
+    def __init__(self, metadata_manager, contents):
+        self.metadata_manager = metadata_manager
+        self.contents = contents  # chunk_id -> bytes
+
+    def download_to_buffer(self, file_id):
+        manifest = self.metadata_manager.load_manifest(file_id)
+        return io.BytesIO(self.contents[manifest.chunks[0].chunk_id])
+
+
+def test_get_file_content_follows_restored_version(tmp_path):
+    metadata_manager = MetadataManager(str(tmp_path))
+    chunk_manager = FakeChunkManager(metadata_manager, {"c1": b"first version", "c2": b"second version"})
+    manifest = FileManifest(original_filename="notes.txt", total_size=13, chunk_size=1024)
+    first_version = manifest.add_version([ChunkInfo(0, "c1", 0, 13)])
+    manifest.add_version([ChunkInfo(0, "c2", 0, 14)])
+    metadata_manager.save_manifest(manifest)
+
+    processor = FileProcessor(metadata_manager, chunk_manager)
+    assert processor.get_file_content(manifest.file_id) == ("notes.txt", "second version")
+
+    manifest.set_current_version(first_version)
+    metadata_manager.save_manifest(manifest)
+    assert processor.get_file_content(manifest.file_id) == ("notes.txt", "first version")
+
+    # The saved text must not bring the replaced version back after a restart either
+    restarted = FileProcessor(metadata_manager, chunk_manager)
+    assert restarted.get_file_content(manifest.file_id) == ("notes.txt", "first version")